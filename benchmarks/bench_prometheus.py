@@ -0,0 +1,101 @@
+"""
+Measures the per-execution cost of prometheus.reset() and prometheus.get_metrics() as the registry grows,
+while the handler changes a single counter. The dir() based implementation used before the changes
+tracking is included as reference.
+
+Run with: python -m benchmarks.bench_prometheus
+"""
+import timeit
+import prometheus_client
+from prometheus_client import CollectorRegistry, Counter, Histogram
+from lambda_powertools import prometheus
+
+REGISTRY_SIZES = (10, 100, 1000)
+CHILDREN_PER_COLLECTOR = 5
+NUMBER = 200
+
+
+def legacy_reset():
+    for collector in prometheus_client.REGISTRY._collector_to_names:
+        if "_value" in dir(collector):
+            collector._value.set(0)
+        elif "_metrics" in dir(collector):
+            for metric in collector._metrics.values():
+                if "_value" in dir(metric):
+                    metric._value.set(0)
+                elif "_buckets" in dir(metric) and "_sum" in dir(metric):
+                    metric._sum.set(0)
+                    for bucket in metric._buckets:
+                        bucket.set(0)
+        elif "_buckets" in dir(collector) and "_sum" in dir(collector):
+            collector._sum.set(0)
+            for bucket in collector._buckets:
+                bucket.set(0)
+
+
+def legacy_filter_metrics(m):
+    if m._type not in ("counter", "histogram"):
+        return False
+    dir_m = dir(m)
+    if "_value" in dir_m and m._value._value == 0:
+        return False
+    if "_buckets" in dir_m and m._sum._value == 0:
+        return False
+    if "_metrics" in dir_m:
+        for metric in m._metrics.values():
+            if ("_value" in dir(metric) and metric._value._value > 0) or ("_sum" in dir(metric) and metric._sum._value > 0):
+                return True
+        return False
+    return True
+
+
+def legacy_get_metrics():
+    new_registry = CollectorRegistry(auto_describe=True)
+    for collector in filter(legacy_filter_metrics, prometheus_client.REGISTRY._collector_to_names):
+        new_registry.register(collector)
+    return prometheus_client.generate_latest(new_registry).decode("utf-8")
+
+
+def create_collectors(size):
+    collectors = []
+    for i in range(size):
+        if i % 2 == 0:
+            collector = Counter(f"bench_counter_{i}", "Benchmark counter", labelnames=["label"])
+        else:
+            collector = Histogram(f"bench_histogram_{i}", "Benchmark histogram", labelnames=["label"])
+        for child in range(CHILDREN_PER_COLLECTOR):
+            collector.labels(str(child))
+        collectors.append(collector)
+    return collectors
+
+
+def run(size):
+    collectors = create_collectors(size)
+    touched = collectors[0].labels("0")
+
+    def execution(reset, get_metrics):
+        def run_execution():
+            reset()
+            touched.inc(1)
+            get_metrics()
+        return run_execution
+
+    prometheus.reset()
+    tracked = timeit.timeit(execution(prometheus.reset, prometheus.get_metrics), number=NUMBER) / NUMBER
+    legacy = timeit.timeit(execution(legacy_reset, legacy_get_metrics), number=NUMBER) / NUMBER
+
+    for collector in collectors:
+        prometheus_client.REGISTRY.unregister(collector)
+
+    return tracked, legacy
+
+
+def main():
+    print(f"{'collectors':>10} {'series':>8} {'tracked (us)':>14} {'legacy (us)':>14}")
+    for size in REGISTRY_SIZES:
+        tracked, legacy = run(size)
+        print(f"{size:>10} {size * CHILDREN_PER_COLLECTOR:>8} {tracked * 1e6:>14.1f} {legacy * 1e6:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
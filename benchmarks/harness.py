@@ -0,0 +1,203 @@
+"""
+Simulates a warm container: runs N sequential invocations of a function wrapped by the PowerHandler in this
+process, with synthetic API Gateway or SQS events, and reports the overhead of the PowerHandler per invocation
+(total time minus the time of the handler), the memory growth and the output written per invocation.
+
+Run with: python -m benchmarks.harness [--invocations 10000] [--event apigw|sqs] [--handler module:function]
+
+The default handler logs a line and increments a counter labeled by route, with --routes distinct routes.
+"""
+import json
+import time
+import uuid
+import argparse
+import array
+import importlib
+import contextlib
+import prometheus_client
+from prometheus_client import Counter
+from lambda_powertools.logger import logger
+from lambda_powertools.profiling import get_rss_bytes, get_peak_rss_bytes
+from lambda_powertools.runtime import power_handler
+
+requests = Counter(
+    name="harness_requests",
+    documentation="Requests handled by the harness handler",
+    labelnames=["route"]
+)
+
+
+def sample_handler(event, context):
+    for record in event.get("Records", [event]):
+        # The API Gateway resource, or the name of the SQS queue
+        route = record.get("resource") or record.get("eventSourceARN", "").rsplit(":", 1)[-1]
+        requests.labels(route).inc()
+        logger.info("Request handled", {"route": route})
+    return {"statusCode": 200}
+
+
+class FakeContext:
+
+    def __init__(self, timeout_ms=30000):
+        self.aws_request_id = str(uuid.uuid4())
+        self.function_name = "harness"
+        self.function_version = "$LATEST"
+        self.memory_limit_in_mb = 128
+        self._deadline_ns = time.monotonic_ns() + timeout_ms * 1000000
+
+    def get_remaining_time_in_millis(self):
+        return max((self._deadline_ns - time.monotonic_ns()) // 1000000, 0)
+
+
+def apigw_event(i, routes):
+    return {
+        "resource": f"/items/{i % routes}",
+        "path": f"/items/{i % routes}",
+        "httpMethod": "GET",
+        "headers": {"x-amz-cf-id": str(uuid.uuid4())},
+        "requestContext": {"apiId": "harness", "requestId": str(uuid.uuid4())},
+        "body": None,
+    }
+
+
+def sqs_event(i, routes, batch_size=10):
+    return {
+        "Records": [
+            {
+                "messageId": str(uuid.uuid4()),
+                "eventSource": "aws:sqs",
+                "eventSourceARN": f"arn:aws:sqs:eu-west-1:000000000000:queue-{(i + record) % routes}",
+                "body": json.dumps({"item": i, "record": record}),
+            }
+            for record in range(batch_size)
+        ]
+    }
+
+
+EVENTS = {"apigw": apigw_event, "sqs": sqs_event}
+
+
+class CountingWriter:
+    """
+    Stands for stdout, counting the bytes written
+    """
+
+    def __init__(self):
+        self.bytes = 0
+
+    def write(self, data):
+        self.bytes += len(data.encode("utf-8"))
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+def get_memory_bytes():
+    """
+    Current resident memory of the process, or the peak one where /proc is not available
+    """
+    rss = get_rss_bytes()
+    return rss if rss is not None else get_peak_rss_bytes()
+
+
+def count_series():
+    count = 0
+    for collector in list(prometheus_client.REGISTRY._collector_to_names):
+        metrics = getattr(collector, "_metrics", None)
+        count += len(metrics) if metrics is not None and collector._labelnames else 1
+    return count
+
+
+def percentiles(values, points=(50, 90, 99)):
+    values = sorted(values)
+    result = {f"p{point}": values[min(len(values) * point // 100, len(values) - 1)] for point in points}
+    result["max"] = values[-1]
+    return result
+
+
+def load_handler(name):
+    if name is None:
+        return sample_handler
+    module_name, function_name = name.split(":")
+    return getattr(importlib.import_module(module_name), function_name)
+
+
+def run(handler, invocations, event_type, routes):
+    handler_ns = 0
+
+    def timed_handler(event, context):
+        nonlocal handler_ns
+        start_ns = time.perf_counter_ns()
+        try:
+            return handler(event, context)
+        finally:
+            handler_ns = time.perf_counter_ns() - start_ns
+
+    wrapped = power_handler(timed_handler)
+    make_event = EVENTS[event_type]
+    writer = CountingWriter()
+
+    # Preallocated, so that the memory used by the measures is not reported as growth
+    overheads = array.array("d", [0.0]) * invocations
+    output_bytes = array.array("q", [0]) * invocations
+    rss_samples = []
+    series_samples = []
+
+    with contextlib.redirect_stdout(writer):
+        for i in range(invocations):
+            event = make_event(i, routes)
+            context = FakeContext()
+            written = writer.bytes
+
+            start_ns = time.perf_counter_ns()
+            wrapped(event, context)
+            total_ns = time.perf_counter_ns() - start_ns
+
+            overheads[i] = (total_ns - handler_ns) / 1000
+            output_bytes[i] = writer.bytes - written
+            if i == 0 or (i + 1) % max(invocations // 10, 1) == 0:
+                rss_samples.append((i + 1, get_memory_bytes()))
+                series_samples.append((i + 1, count_series()))
+
+    # The first invocation is the cold start, the growth is measured on the warm ones
+    (first, first_rss), (last, last_rss) = rss_samples[0], rss_samples[-1]
+    growth_per_1000 = (last_rss - first_rss) / max(last - first, 1) * 1000
+
+    return {
+        "invocations": invocations,
+        "event": event_type,
+        "overhead_us": {key: round(value, 1) for key, value in percentiles(overheads[1:] or overheads).items()},
+        "cold_start_overhead_us": round(overheads[0], 1),
+        "output_bytes_per_invocation": percentiles(output_bytes),
+        "rss_bytes": dict(rss_samples),
+        "rss_growth_bytes_per_1000_invocations": round(growth_per_1000),
+        "series": dict(series_samples),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Warm container load harness for the PowerHandler")
+    parser.add_argument("--invocations", type=int, default=10000)
+    parser.add_argument("--event", choices=sorted(EVENTS), default="apigw")
+    parser.add_argument("--routes", type=int, default=50, help="distinct routes (label values) of the events")
+    parser.add_argument("--handler", help="handler to run, as module:function (default a sample handler)")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = parser.parse_args(argv)
+
+    report = run(load_handler(args.handler), args.invocations, args.event, args.routes)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+
+    print(f"{report['invocations']} invocations with {report['event']} events")
+    print(f"overhead (us): cold start {report['cold_start_overhead_us']}, " + ", ".join(f"{key} {value}" for key, value in report["overhead_us"].items()))
+    print("output bytes per invocation: " + ", ".join(f"{key} {value}" for key, value in report["output_bytes_per_invocation"].items()))
+    print(f"rss growth: {report['rss_growth_bytes_per_1000_invocations']} bytes per 1000 invocations")
+    print("rss bytes by invocation: " + ", ".join(f"{key}: {value}" for key, value in report["rss_bytes"].items()))
+    print("series by invocation: " + ", ".join(f"{key}: {value}" for key, value in report["series"].items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+"""
+Measures the cost of the hot paths of the library (logging, serialization, metrics reset and export, and the
+PowerHandler wrapper) in parameterized scenarios, as the registry size, the context size and the log volume grow.
+
+Run with: python -m benchmarks.suite [--filter NAME] [--save results.json] [--compare baseline.json]
+
+The results can be saved as JSON and compared with a saved baseline: the command exits with status 1 when a
+scenario is slower than the baseline by more than the threshold (default 20%).
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import contextlib
+import prometheus_client
+from benchmarks.bench_prometheus import create_collectors, CHILDREN_PER_COLLECTOR
+from lambda_powertools import prometheus
+from lambda_powertools.config import Config
+from lambda_powertools.logger import logger
+from lambda_powertools.runtime import power_handler
+from lambda_powertools.utils import serialize_log
+
+SERIES = (10, 100, 1000)
+CONTEXT_KEYS = (0, 10, 100)
+REPEAT = 5
+MIN_TIME = 0.05
+
+CONTEXT = type("", (object,), {"aws_request_id": "a6c52e8a-4d3a-4f43-9a9a-cc1a1b3c4f51"})()
+
+
+def get_context(keys):
+    return {f"key_{i}": f"value_{i}" for i in range(keys)}
+
+
+@contextlib.contextmanager
+def registry(series):
+    collectors = create_collectors(max(series // CHILDREN_PER_COLLECTOR, 1))
+    prometheus.reset()
+    try:
+        yield collectors
+    finally:
+        for collector in collectors:
+            prometheus_client.REGISTRY.unregister(collector)
+        prometheus.reset()
+
+
+@contextlib.contextmanager
+def logger_log(context_keys, emitted):
+    logger.reset()
+    logger.capture(env=os.environ, event={}, context=CONTEXT)
+    logger.set_level("INFO")
+    if context_keys:
+        logger.add_context(**get_context(context_keys))
+
+    log = logger.info if emitted else logger.debug
+    yield lambda: log("Benchmark message", {"foo": "bar"})
+
+
+@contextlib.contextmanager
+def serializer(context_keys):
+    log = {**get_context(context_keys), "time": 1679313252708, "loglevel": "INFO", "message": "Benchmark message"}
+    yield lambda: serialize_log(log)
+
+
+@contextlib.contextmanager
+def prometheus_reset(series):
+    with registry(series) as collectors:
+        touched = collectors[0].labels("0")
+
+        def run():
+            touched.inc(1)
+            prometheus.reset()
+
+        yield run
+
+
+@contextlib.contextmanager
+def prometheus_get_metrics(series):
+    with registry(series) as collectors:
+        collectors[0].labels("0").inc(1)
+        yield prometheus.get_metrics
+
+
+@contextlib.contextmanager
+def handler(series, context_keys):
+    with registry(series) as collectors:
+        touched = collectors[0].labels("0")
+        log_context = get_context(context_keys)
+
+        def lambda_body(event, context):
+            touched.inc(1)
+            logger.info("Benchmark message", log_context)
+
+        wrapped = power_handler(lambda_body)
+        yield lambda: wrapped({}, CONTEXT)
+
+
+SCENARIOS = (
+    [("logger.log", {"context_keys": keys, "emitted": emitted}, logger_log) for keys in CONTEXT_KEYS for emitted in (True, False)]
+    + [("serialize_log", {"context_keys": keys}, serializer) for keys in CONTEXT_KEYS]
+    + [("prometheus.reset", {"series": series}, prometheus_reset) for series in SERIES]
+    + [("prometheus.get_metrics", {"series": series}, prometheus_get_metrics) for series in SERIES]
+    + [("power_handler", {"series": series, "context_keys": 10}, handler) for series in SERIES]
+)
+
+
+def get_scenario_id(name, params):
+    return name + "[" + ",".join(f"{key}={value}" for key, value in params.items()) + "]"
+
+
+def measure(run):
+    """
+    Returns the best and the median time per call in ns, over REPEAT runs lasting at least MIN_TIME each
+    """
+    number = 1
+    while True:
+        start = time.perf_counter_ns()
+        for _ in range(number):
+            run()
+        elapsed = time.perf_counter_ns() - start
+        if elapsed >= MIN_TIME * 1e9:
+            break
+        number *= 2
+
+    timings = [elapsed / number]
+    for _ in range(REPEAT - 1):
+        start = time.perf_counter_ns()
+        for _ in range(number):
+            run()
+        timings.append((time.perf_counter_ns() - start) / number)
+
+    timings.sort()
+    return {"best_ns": round(timings[0], 1), "median_ns": round(timings[len(timings) // 2], 1), "number": number}
+
+
+def run_scenarios(name_filter=None):
+    results = {}
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for name, params, scenario in SCENARIOS:
+            scenario_id = get_scenario_id(name, params)
+            if name_filter and name_filter not in scenario_id:
+                continue
+            with scenario(**params) as run:
+                results[scenario_id] = measure(run)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Prints the change of each scenario compared to the baseline and returns the ids of the regressed ones
+    """
+    regressions = []
+    print(f"{'scenario':<60} {'baseline (us)':>14} {'current (us)':>14} {'change':>8}")
+    for scenario_id, result in results.items():
+        if scenario_id not in baseline:
+            continue
+        before = baseline[scenario_id]["best_ns"]
+        after = result["best_ns"]
+        change = after / before - 1 if before else 0
+        flag = ""
+        if change > threshold:
+            regressions.append(scenario_id)
+            flag = " REGRESSION"
+        print(f"{scenario_id:<60} {before / 1000:>14.2f} {after / 1000:>14.2f} {change:>+8.1%}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks of the lambda_powertools hot paths")
+    parser.add_argument("--filter", help="run only the scenarios containing this string")
+    parser.add_argument("--save", help="save the results as JSON to this file")
+    parser.add_argument("--compare", help="compare the results with the baseline saved in this file")
+    parser.add_argument("--threshold", type=float, default=0.2, help="max slowdown allowed by --compare (default 0.2)")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    args = parser.parse_args(argv)
+
+    Config.reload()
+    results = run_scenarios(args.filter)
+
+    output = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "prometheus_client": prometheus_client.__version__ if hasattr(prometheus_client, "__version__") else None,
+        "results": results,
+    }
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(output, f, indent=2)
+
+    if args.json:
+        print(json.dumps(output, indent=2))
+    elif not args.compare:
+        print(f"{'scenario':<60} {'best (us)':>12} {'median (us)':>12}")
+        for scenario_id, result in results.items():
+            print(f"{scenario_id:<60} {result['best_ns'] / 1000:>12.2f} {result['median_ns'] / 1000:>12.2f}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["results"]
+        if compare(results, baseline, args.threshold):
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,202 @@
+import time
+import json
+import asyncio
+import inspect
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from prometheus_client import Counter, Histogram
+from lambda_powertools.logger import logger
+from lambda_powertools.runtime import power_handler
+
+_records = Counter(
+    name="lambda_powertools_batch_records",
+    documentation="Number of batch records processed, by outcome (success or failure)",
+    labelnames=["outcome"]
+)
+
+_record_duration = Histogram(
+    name="lambda_powertools_batch_record_duration_seconds",
+    documentation="Duration of the processing of a batch record, by outcome (success or failure)",
+    labelnames=["outcome"]
+)
+
+_record_metrics = {outcome: (_records.labels(outcome), _record_duration.labels(outcome)) for outcome in ("success", "failure")}
+
+
+def get_record_context(record):
+    """
+    Returns the identifier of the record reported in the batch item failures, and the fields added to its logs
+    """
+    event_source = record.get("eventSource")
+
+    if event_source == "aws:kinesis":
+        sequence_number = record["kinesis"]["sequenceNumber"]
+        return sequence_number, {"sequence_number": sequence_number, "partition_key": record["kinesis"].get("partitionKey")}
+
+    if event_source == "aws:dynamodb":
+        sequence_number = record["dynamodb"]["SequenceNumber"]
+        return sequence_number, {"sequence_number": sequence_number, "event_id": record.get("eventID")}
+
+    return record["messageId"], {"message_id": record["messageId"]}
+
+
+def get_ordering_key(record):
+    """
+    Returns the key of the records that must be processed in order (the message group of a FIFO queue, the partition
+    key of a Kinesis stream or the item keys of a DynamoDB stream), or None if the record is not ordered
+    """
+    event_source = record.get("eventSource")
+
+    if event_source == "aws:kinesis":
+        return record["kinesis"].get("partitionKey")
+
+    if event_source == "aws:dynamodb":
+        return json.dumps(record["dynamodb"].get("Keys"), sort_keys=True)
+
+    return record.get("attributes", {}).get("MessageGroupId")
+
+
+def _group_records(records):
+    """
+    Returns the indexes of the records grouped by ordering key, in order. Each record not ordered is in its own group
+    """
+    groups = {}
+    for index, record in enumerate(records):
+        key = get_ordering_key(record)
+        groups.setdefault(index if key is None else ("key", key), []).append(index)
+    return list(groups.values())
+
+
+def _record_outcome(outcome, start):
+    records, duration = _record_metrics[outcome]
+    records.inc()
+    duration.observe(time.perf_counter() - start)
+
+
+def _process_record(record_handler, record, context):
+    identifier, fields = get_record_context(record)
+    logger.add_context(**fields)
+
+    start = time.perf_counter()
+    try:
+        record_handler(record, context)
+    except Exception as e:
+        logger.error("Batch record processing failed", error=e)
+        _record_outcome("failure", start)
+        return identifier
+
+    _record_outcome("success", start)
+    return None
+
+
+async def _process_record_async(record_handler, record, context, semaphore):
+    async with semaphore:
+        identifier, fields = get_record_context(record)
+        logger.add_context(**fields)
+
+        start = time.perf_counter()
+        try:
+            await record_handler(record, context)
+        except Exception as e:
+            logger.error("Batch record processing failed", error=e)
+            _record_outcome("failure", start)
+            return identifier
+
+        _record_outcome("success", start)
+        return None
+
+
+def _process_records(record_handler, records, context):
+    """
+    Processes the records one after the other: after a failure, the following records with the same ordering key
+    are reported as failed without being processed, so they are retried in order
+    """
+    failures = []
+    failed_keys = set()
+    for record in records:
+        key = get_ordering_key(record)
+        if key is not None and key in failed_keys:
+            failures.append(get_record_context(record)[0])
+            continue
+
+        failure = contextvars.copy_context().run(_process_record, record_handler, record, context)
+        if failure is not None and key is not None:
+            failed_keys.add(key)
+        failures.append(failure)
+    return failures
+
+
+async def _process_records_async(record_handler, records, context, semaphore):
+    failures = []
+    failed_keys = set()
+    for record in records:
+        key = get_ordering_key(record)
+        if key is not None and key in failed_keys:
+            failures.append(get_record_context(record)[0])
+            continue
+
+        # Each record runs in its own task, so in its own logger context
+        failure = await asyncio.create_task(_process_record_async(record_handler, record, context, semaphore))
+        if failure is not None and key is not None:
+            failed_keys.add(key)
+        failures.append(failure)
+    return failures
+
+
+def _ordered_failures(groups, group_failures):
+    failures = {}
+    for indexes, identifiers in zip(groups, group_failures):
+        failures.update(zip(indexes, identifiers))
+    return [failures[index] for index in sorted(failures)]
+
+
+def _failures_response(failures):
+    return {"batchItemFailures": [{"itemIdentifier": identifier} for identifier in failures if identifier is not None]}
+
+
+def batch_handler(record_handler, max_concurrency=10):
+    """
+    Returns a Lambda handler, wrapped by the PowerHandler, processing the records of a SQS, Kinesis or DynamoDB
+    batch with record_handler(record, context), up to max_concurrency records at a time: on a thread pool,
+    or on the event loop when record_handler is async. Each record is processed in its own logger context.
+
+    The records of the same FIFO message group, Kinesis partition key or DynamoDB item are processed in order,
+    one after the other: once one of them fails, the following ones are reported as failed without being processed.
+
+    The handler returns the identifiers of the failed records in the partial batch response format
+    (it requires ReportBatchItemFailures to be enabled on the event source mapping).
+    """
+    executor = None
+
+    def process_batch(event, context):
+        nonlocal executor
+
+        records = event.get("Records", [])
+
+        if max_concurrency <= 1 or len(records) <= 1:
+            return _failures_response(_process_records(record_handler, records, context))
+
+        if executor is None:
+            # Kept across executions, so the threads are not created on every invocation
+            executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="lambda-powertools-batch")
+
+        groups = _group_records(records)
+        futures = [
+            executor.submit(_process_records, record_handler, [records[index] for index in indexes], context)
+            for indexes in groups
+        ]
+        return _failures_response(_ordered_failures(groups, [future.result() for future in futures]))
+
+    async def process_batch_async(event, context):
+        records = event.get("Records", [])
+        semaphore = asyncio.Semaphore(max(max_concurrency, 1))
+        groups = _group_records(records)
+        group_failures = await asyncio.gather(*[
+            _process_records_async(record_handler, [records[index] for index in indexes], context, semaphore)
+            for indexes in groups
+        ])
+        return _failures_response(_ordered_failures(groups, group_failures))
+
+    if inspect.iscoroutinefunction(record_handler):
+        return power_handler(process_batch_async)
+    return power_handler(process_batch)
@@ -1,17 +1,141 @@
 import os
-from lambda_powertools.utils import parse_bool
+from lambda_powertools.utils import parse_bool, parse_int, parse_float, parse_levels
 
 
 class Config:
-    LOG_THROTTLE = {
-        "INFO": 0.1,  # 10%
-        "WARN": 0.2  # 20%
-    }
+    """
+    Settings read from the environment. They are parsed once, when the module is imported,
+    so they can be read on the hot path as plain attributes. Use reload() to parse the
+    environment again and override() to change them from code.
+    """
+    # Incremented each time the settings change, so that the values derived from them can be cached
+    VERSION = 0
+    LOG_LEVEL = None
+    LOG_LEVELS = None
+    LOG_THROTTLE_ENABLED = None
+    LOG_THROTTLE = None
+    LOG_THROTTLE_MODE = None
+    LOG_RATE_LIMIT = None
+    LOG_RATE_LIMIT_REFILL = None
+    LOG_ERROR_MAX_FRAMES = None
+    LOG_ERROR_STACK_MODE = None
+    LOG_MAX_FIELD_BYTES = None
+    LOG_MAX_RECORD_BYTES = None
+    LOG_AGGREGATION_ENABLED = None
+    LOG_AGGREGATION_SAMPLE_SIZE = None
+    LOG_AGGREGATION_MAX_KEYS = None
+    LOG_BUFFER_ENABLED = None
+    LOG_BUFFER_MAX_RECORDS = None
+    LOG_BUFFER_MAX_BYTES = None
+    OUTPUT_BACKGROUND_ENABLED = None
+    OUTPUT_QUEUE_SIZE = None
+    OUTPUT_QUEUE_FULL_POLICY = None
+    METRICS_FORMAT = None
+    METRICS_EMF_NAMESPACE = None
+    METRICS_MAX_SERIES = None
+    METRICS_SERIES_MAX_IDLE = None
+    METRICS_OVERFLOW_LABEL_VALUE = None
+    INSTRUMENTATION_ENABLED = None
+    METRICS_TIMING_ENABLED = None
+    MEMORY_PROFILING_ENABLED = None
+    MEMORY_PROFILING_TRACEMALLOC = None
+    MEMORY_PROFILING_TOP = None
+
+    @classmethod
+    def reload(cls, env=None):
+        if env is None:
+            env = os.environ
+
+        cls.LOG_LEVEL = env.get("LOG_LEVEL", "INFO")
+        # Levels of the named loggers and their children, e.g. "db=DEBUG,http.client=WARN"
+        cls.LOG_LEVELS = parse_levels(env.get("LOG_LEVELS"))
+
+        cls.LOG_THROTTLE_ENABLED = parse_bool(env.get("LOG_THROTTLE_ENABLED"), False)
+        cls.LOG_THROTTLE = {
+            "INFO": parse_float(env.get("LOG_THROTTLE_INFO"), 0.1),  # 10%
+            "WARN": parse_float(env.get("LOG_THROTTLE_WARN"), 0.2),  # 20%
+        }
+        for level_name in ("DEBUG", "ERROR"):
+            if env.get(f"LOG_THROTTLE_{level_name}") is not None:
+                cls.LOG_THROTTLE[level_name] = parse_float(env.get(f"LOG_THROTTLE_{level_name}"), 1)
+        # "record" samples each log independently, "request" samples whole requests by aws_request_id
+        cls.LOG_THROTTLE_MODE = env.get("LOG_THROTTLE_MODE", "record").lower()
+
+        # Max number of logs per level and execution, optionally refilled by a number of logs per second
+        cls.LOG_RATE_LIMIT = {}
+        cls.LOG_RATE_LIMIT_REFILL = {}
+        for level_name in ("DEBUG", "INFO", "WARN", "ERROR"):
+            limit = parse_int(env.get(f"LOG_RATE_LIMIT_{level_name}"), None)
+            if limit is not None:
+                cls.LOG_RATE_LIMIT[level_name] = limit
+                cls.LOG_RATE_LIMIT_REFILL[level_name] = parse_float(env.get(f"LOG_RATE_LIMIT_{level_name}_REFILL"), 0)
+
+        # Max number of frames of the logged error stacks, the innermost ones (0 is unlimited). With the "fingerprint"
+        # mode, the stack is logged only the first time in the execution, then only its fingerprint ("full" always).
+        cls.LOG_ERROR_MAX_FRAMES = parse_int(env.get("LOG_ERROR_MAX_FRAMES"), 50)
+        cls.LOG_ERROR_STACK_MODE = env.get("LOG_ERROR_STACK_MODE", "full").lower()
+
+        # Max size of each field and of the whole log, the oversized ones are truncated (0 is unlimited)
+        cls.LOG_MAX_FIELD_BYTES = parse_int(env.get("LOG_MAX_FIELD_BYTES"), 0)
+        cls.LOG_MAX_RECORD_BYTES = parse_int(env.get("LOG_MAX_RECORD_BYTES"), 0)
+
+        # Repeated logs (same level and message) of an execution written once, followed by a summary with the
+        # number of occurrences and a sample of their different contexts. Up to max keys logs are tracked
+        cls.LOG_AGGREGATION_ENABLED = parse_bool(env.get("LOG_AGGREGATION_ENABLED"), False)
+        cls.LOG_AGGREGATION_SAMPLE_SIZE = parse_int(env.get("LOG_AGGREGATION_SAMPLE_SIZE"), 3)
+        cls.LOG_AGGREGATION_MAX_KEYS = parse_int(env.get("LOG_AGGREGATION_MAX_KEYS"), 1000)
+
+        cls.LOG_BUFFER_ENABLED = parse_bool(env.get("LOG_BUFFER_ENABLED"), False)
+        cls.LOG_BUFFER_MAX_RECORDS = parse_int(env.get("LOG_BUFFER_MAX_RECORDS"), 1000)
+        cls.LOG_BUFFER_MAX_BYTES = parse_int(env.get("LOG_BUFFER_MAX_BYTES"), 128 * 1024)
+
+        # Logs and metrics written to stdout by a background thread. When the queue is full the output
+        # is dropped ("drop") or the caller waits ("block").
+        cls.OUTPUT_BACKGROUND_ENABLED = parse_bool(env.get("OUTPUT_BACKGROUND_ENABLED"), False)
+        cls.OUTPUT_QUEUE_SIZE = parse_int(env.get("OUTPUT_QUEUE_SIZE"), 10000)
+        cls.OUTPUT_QUEUE_FULL_POLICY = env.get("OUTPUT_QUEUE_FULL_POLICY", "block").lower()
+
+        # "promlog" (Prometheus text format), "compact" (see lambda_powertools.promdelta), "emf" (CloudWatch
+        # Embedded Metric Format) or the name of an exporter registered with prometheus.register_exporter()
+        cls.METRICS_FORMAT = env.get("METRICS_FORMAT", "promlog").lower()
+        cls.METRICS_EMF_NAMESPACE = env.get("METRICS_EMF_NAMESPACE", "lambda_powertools")
+
+        # Max number of labeled series per metric (0 is unlimited). Once reached, the least recently changed series
+        # is evicted, or new label sets are merged into the overflow series if all were changed in the execution.
+        cls.METRICS_MAX_SERIES = parse_int(env.get("METRICS_MAX_SERIES"), 0)
+        # Number of executions without changes after which a labeled series is evicted (0 is never)
+        cls.METRICS_SERIES_MAX_IDLE = parse_int(env.get("METRICS_SERIES_MAX_IDLE"), 0)
+        cls.METRICS_OVERFLOW_LABEL_VALUE = env.get("METRICS_OVERFLOW_LABEL_VALUE", "__overflow__")
+
+        # Metrics about the executions of the PowerHandler: handler duration, cold start and overhead of the library
+        cls.INSTRUMENTATION_ENABLED = parse_bool(env.get("INSTRUMENTATION_ENABLED"), False)
+
+        # Durations measured by lambda_powertools.timing.timed, which does nothing when disabled
+        cls.METRICS_TIMING_ENABLED = parse_bool(env.get("METRICS_TIMING_ENABLED"), True)
+
+        # Memory profiling of every execution (or of the requests with the x-profile-memory header), optionally
+        # with the top allocation sites traced by tracemalloc
+        cls.MEMORY_PROFILING_ENABLED = parse_bool(env.get("MEMORY_PROFILING_ENABLED"), False)
+        cls.MEMORY_PROFILING_TRACEMALLOC = parse_bool(env.get("MEMORY_PROFILING_TRACEMALLOC"), False)
+        cls.MEMORY_PROFILING_TOP = parse_int(env.get("MEMORY_PROFILING_TOP"), 10)
+
+        cls.VERSION += 1
+
+    @classmethod
+    def override(cls, **settings):
+        for name, value in settings.items():
+            if not name.isupper() or not hasattr(cls, name):
+                raise AttributeError(f"Unknown setting {name}")
+            setattr(cls, name, value)
+        cls.VERSION += 1
 
     @classmethod
     def is_log_throttle_enabled(cls):
-        return parse_bool(os.environ.get("LOG_THROTTLE_ENABLED"), False)
+        return cls.LOG_THROTTLE_ENABLED
 
     @classmethod
     def get_log_throttle(cls, level_name):
         return cls.LOG_THROTTLE.get(level_name)
+
+
+Config.reload()
@@ -1,22 +1,49 @@
-import os
-import random
-import datetime
-import traceback
+import zlib
+import threading
+import contextvars
 from lambda_powertools.config import Config
-from lambda_powertools.utils import serialize_log
+from lambda_powertools.sink import StdoutSink, BufferedSink, BackgroundSink, get_background_writer
+from lambda_powertools.utils import serialize_log, serialize_log_limited, serialize_fields, MonotonicClock, TokenBucket, StackFormatter
+
+DEBUG = 20
+INFO = 30
+WARN = 40
+ERROR = 50
+
+# Context (fields and their serialization) added by the current thread or asyncio task with add_context().
+# When not set, the context captured for the execution is used.
+_task_context = contextvars.ContextVar("lambda_powertools_logger_context", default=None)
 
 
 class Logger:
 
     def __init__(self):
         self.LEVELS = {
-            "DEBUG": 20,
-            "INFO": 30,
-            "WARN": 40,
-            "ERROR": 50,
+            "DEBUG": DEBUG,
+            "INFO": INFO,
+            "WARN": WARN,
+            "ERROR": ERROR,
         }
         self._level = None
+        # Guards the state changed by every log (suppressed counts, aggregated logs, truncated count) against
+        # concurrent threads
+        self._lock = threading.Lock()
         self._context = None
+        self._context_fragment = None
+        self._clock = MonotonicClock()
+        self._sink = None
+        self._sampling_key = None
+        self._rate_limits = None
+        self._suppressed = None
+        self._stack_formatter = None
+        self._logged_stacks = None
+        self._aggregated = None
+        # Named loggers by name, and the settings version and level their levels were computed for.
+        # The named loggers already returned are kept when Logger() is called again.
+        self._named = self.__dict__.get("_named", {})
+        self._named_levels_for = None
+        # Number of logs truncated because oversized, since the logger was created
+        self.truncated = 0
         self.reset()
 
     def __new__(cls):
@@ -25,11 +52,102 @@ class Logger:
         return cls.instance
 
     def reset(self):
-        self._level = self.LEVELS[os.environ.get("LOG_LEVEL", "INFO")]
+        # Records still buffered from a previous execution must not be lost
+        self.flush()
+
+        self._level = self.LEVELS[Config.LOG_LEVEL]
         self._context = {}
+        self._context_fragment = ""
+        _task_context.set(None)
+        self._clock.anchor()
+        self._sampling_key = None
+        self._rate_limits = {
+            level_name: TokenBucket(limit, Config.LOG_RATE_LIMIT_REFILL.get(level_name, 0))
+            for level_name, limit in Config.LOG_RATE_LIMIT.items()
+        }
+        self._suppressed = {}
+
+        # The formatted stacks are cached across executions, the fingerprints already logged are per execution
+        if self._stack_formatter is None or self._stack_formatter.max_frames != Config.LOG_ERROR_MAX_FRAMES:
+            self._stack_formatter = StackFormatter(Config.LOG_ERROR_MAX_FRAMES)
+        self._logged_stacks = set()
+
+        # Repeated logs of the execution by level and message, written once when flushed
+        self._aggregated = {} if Config.LOG_AGGREGATION_ENABLED else None
+
+        writer = get_background_writer() if Config.OUTPUT_BACKGROUND_ENABLED else None
+        if Config.LOG_BUFFER_ENABLED:
+            self._sink = BufferedSink(
+                max_records=Config.LOG_BUFFER_MAX_RECORDS,
+                max_bytes=Config.LOG_BUFFER_MAX_BYTES,
+                writer=writer
+            )
+        elif writer is not None:
+            self._sink = BackgroundSink(writer)
+        else:
+            self._sink = StdoutSink()
+
+        self._update_named_levels()
+
+    def flush(self):
+        if self._aggregated:
+            self._write_aggregated()
+        if self._sink is not None:
+            self._sink.flush()
+
+    def close(self):
+        """
+        Completes the execution, writing the summary of the suppressed logs and flushing the pending ones
+        """
+        with self._lock:
+            suppressed = self._suppressed
+            self._suppressed = {}
+        if suppressed:
+            self.report("Logs suppressed", suppressed)
+
+        self.flush()
+
+    def report(self, message, context):
+        """
+        Writes an INFO log regardless of the level, the throttling and the rate limit, for the reports about
+        the execution itself (e.g. the summary of the suppressed logs)
+        """
+        self._write("INFO", message, context)
 
     def set_level(self, level_name):
         self._level = self.LEVELS.get(level_name, self._level)
+        self._update_named_levels()
+
+    def get_logger(self, name):
+        """
+        Returns the logger with the given name, adding it to its logs. Its level is the one configured in
+        LOG_LEVELS for the name or for its closest parent (e.g. "db" for "db.pool"), the level of this
+        logger otherwise.
+        """
+        named = self._named.get(name)
+        if named is None:
+            named = self._named[name] = NamedLogger(self, name)
+            named._level = self._get_effective_level(name)
+        return named
+
+    def _get_effective_level(self, name):
+        levels = Config.LOG_LEVELS
+        while name:
+            if name in levels:
+                return self.LEVELS[levels[name]]
+            name = name.rpartition(".")[0]
+        return self._level
+
+    def _update_named_levels(self):
+        # The levels are computed again only when the settings or the level of this logger change
+        if self._named_levels_for == (Config.VERSION, self._level):
+            return
+        self._named_levels_for = (Config.VERSION, self._level)
+        for name, named in self._named.items():
+            named._level = self._get_effective_level(name)
+
+    def is_enabled(self, level_name):
+        return self.LEVELS[level_name] >= self._level
 
     def capture(self, env=None, event=None, context=None):
         function_name = None
@@ -69,19 +187,93 @@ class Logger:
         if aws_cf_request_id is not None:
             self._context["aws_cf_request_id"] = aws_cf_request_id
 
+        # The captured context is the same for every log of the execution, so it's serialized only once
+        self._context_fragment = serialize_fields(self._context)
+        _task_context.set(None)
+
         if event is not None and event.get("headers") and event["headers"].get("x-debug") == "true":
             self.set_level("DEBUG")
 
+        # Value in [0, 1) derived from the request id, so the throttling decision is the same for all its logs
+        if aws_request_id is not None:
+            self._sampling_key = zlib.crc32(aws_request_id.encode("utf-8")) / 2 ** 32
+
+    def add_context(self, **fields):
+        """
+        Adds the fields to the logs of the current thread or asyncio task only, including the tasks it creates
+        afterwards, so that concurrent work doesn't share its context
+        """
+        context, _ = self._get_context()
+        context = {**context, **fields}
+        _task_context.set((context, serialize_fields(context)))
+
+    def bind(self, **fields):
+        """
+        Returns a logger adding the fields to every log
+        """
+        return BoundLogger(self, fields)
+
+    def _get_context(self):
+        task_context = _task_context.get()
+        if task_context is None:
+            return self._context, self._context_fragment
+        return task_context
+
     def should_throttle(self, level_name):
         # If the throttle is disabled or the logger is configured in debug level we don't throttle anything
-        if not Config.is_log_throttle_enabled() or self._level == self.LEVELS["DEBUG"]:
+        if not Config.LOG_THROTTLE_ENABLED or self._level == self.LEVELS["DEBUG"]:
             return False
-        return random.random() > (Config.get_log_throttle(level_name) or 1)
 
-    def log(self, level_name, message, context=None, error=None):
-        if self.LEVELS[level_name] < self._level or self.should_throttle(level_name):
+        rate = Config.LOG_THROTTLE.get(level_name)
+        if rate is None:
+            return False
+        if Config.LOG_THROTTLE_MODE == "request" and self._sampling_key is not None:
+            return self._sampling_key >= rate
+
+        # Imported on first use, to keep it out of the cold start when the throttling is disabled
+        import random
+        return random.random() >= rate
+
+    def should_rate_limit(self, level_name):
+        bucket = self._rate_limits.get(level_name)
+        return bucket is not None and not bucket.consume()
+
+    def _count_suppressed(self, reason, level_name):
+        key = f"{reason}_{level_name.lower()}"
+        with self._lock:
+            self._suppressed[key] = self._suppressed.get(key, 0) + 1
+
+    def log(self, level_name, message, context=None, error=None, args=None):
+        """
+        The message can be a callable returning the message, and can be formatted %-style with args (a
+        tuple or a dict). The context can be a callable returning the context. They are evaluated only
+        when the log is actually written, so building them costs nothing for suppressed logs.
+        """
+        if self.LEVELS[level_name] >= self._level:
+            self._log(level_name, message, context, error, args, None)
+
+    def _log(self, level_name, message, context, error, args, bound):
+        # The level is checked by the caller
+        # Throttling is sampling by design, so only the logs dropped by the rate limit are summarized
+        if self.should_throttle(level_name):
+            return
+        # The repetitions collapsed by the aggregation are not written, so they don't consume the rate limit
+        aggregated = self._aggregated is not None and level_name != "ERROR"
+        if self._rate_limits and not aggregated and self.should_rate_limit(level_name):
+            self._count_suppressed("rate_limited", level_name)
+            return
+
+        if callable(message):
+            message = message()
+        if args is not None:
+            message = message % args
+
+        if self._rate_limits and aggregated and (level_name, message) not in self._aggregated and self.should_rate_limit(level_name):
+            self._count_suppressed("rate_limited", level_name)
             return
 
+        if callable(context):
+            context = context()
         if context is None:
             context = {}
 
@@ -89,32 +281,203 @@ class Logger:
             """
             If the error is provided we use the context to pass custom object
             """
+            stack, fingerprint = self._stack_formatter.format(error)
             context["error_message"] = str(error)
-            context["error_stack"] = "\n".join(traceback.format_exc().splitlines())
-
-        log_str = serialize_log(
-            {
-                **self._context,
-                **(context or {}),
-                "time": int(datetime.datetime.now().timestamp() * 1000),
-                "loglevel": level_name,
-                "message": message,
+            if Config.LOG_ERROR_STACK_MODE == "fingerprint":
+                context["error_fingerprint"] = fingerprint
+                if fingerprint not in self._logged_stacks:
+                    self._logged_stacks.add(fingerprint)
+                    context["error_stack"] = stack
+            else:
+                context["error_stack"] = stack
+
+        self._write(level_name, message, context, bound)
+
+    def _aggregate(self, level_name, message, context, fields, fragment, now_ms):
+        """
+        Tracks the log, returning whether it's a repetition that must not be written
+        """
+        key = (level_name, message)
+
+        with self._lock:
+            entry = self._aggregated.get(key)
+            if entry is None:
+                if len(self._aggregated) < Config.LOG_AGGREGATION_MAX_KEYS:
+                    # Copy of the context of the first log, captured fields and fragment, first and last time,
+                    # count, context sample
+                    self._aggregated[key] = [dict(context), fields, fragment, now_ms, now_ms, 1, []]
+                return False
+
+            entry[4] = now_ms
+            entry[5] += 1
+            sample = entry[6]
+            if context and len(sample) < Config.LOG_AGGREGATION_SAMPLE_SIZE and context != entry[0] and context not in sample:
+                sample.append(dict(context))
+            return True
+
+    def _write_aggregated(self):
+        with self._lock:
+            aggregated = self._aggregated
+            self._aggregated = {}
+
+        for (level_name, message), (_, fields, fragment, first_ms, last_ms, count, sample) in aggregated.items():
+            if count == 1:
+                continue
+
+            context = {
+                "aggregated_count": count,
+                "aggregated_first_time": first_ms,
+                "aggregated_last_time": last_ms,
             }
-        )
+            if sample:
+                context["aggregated_context_sample"] = sample
+            self._write_record(level_name, message, context, fields, fragment, last_ms)
+
+    def _write(self, level_name, message, context, bound=None):
+        fields, fragment = self._get_context()
+        if bound is not None:
+            fields, fragment = bound._merge(fields, fragment)
+
+        now_ms = self._clock.now_ms()
+
+        # The first occurrence is written immediately, the following ones are summarized on flush. Errors are never aggregated
+        if self._aggregated is not None and level_name != "ERROR" and self._aggregate(level_name, message, context, fields, fragment, now_ms):
+            return
+
+        self._write_record(level_name, message, context, fields, fragment, now_ms)
+
+    def _write_record(self, level_name, message, context, fields, fragment, time_ms):
+        log = {
+            **context,
+            "time": time_ms,
+            "loglevel": level_name,
+            "message": message,
+        }
+
+        if context and not fields.keys().isdisjoint(context):
+            # The provided context overrides some captured field, so the pre-serialized one can't be used
+            log, fragment = {**fields, **log}, None
+
+        if Config.LOG_MAX_FIELD_BYTES or Config.LOG_MAX_RECORD_BYTES:
+            log_str, truncated = serialize_log_limited(
+                log, fragment, Config.LOG_MAX_FIELD_BYTES, Config.LOG_MAX_RECORD_BYTES
+            )
+            if truncated:
+                with self._lock:
+                    self.truncated += 1
+        else:
+            log_str = serialize_log(log, prefix=fragment)
+
+        self._sink.write(log_str)
+
+        # Errors are written immediately, so they are not lost if the execution crashes right after
+        if level_name == "ERROR":
+            self._sink.flush()
+
+    # The level is checked before calling log() so that suppressed logs cost a single comparison
+    def debug(self, message, context=None, error=None, args=None):
+        if self._level <= DEBUG:
+            self._log("DEBUG", message, context, error, args, None)
+
+    def info(self, message, context=None, error=None, args=None):
+        if self._level <= INFO:
+            self._log("INFO", message, context, error, args, None)
 
-        print(f"{log_str}\n")
+    def warn(self, message, context=None, error=None, args=None):
+        if self._level <= WARN:
+            self._log("WARN", message, context, error, args, None)
 
-    def debug(self, message, context=None, error=None):
-        self.log("DEBUG", message, context, error)
+    def error(self, message, context=None, error=None, args=None):
+        if self._level <= ERROR:
+            self._log("ERROR", message, context, error, args, None)
 
-    def info(self, message, context=None, error=None):
-        self.log("INFO", message, context, error)
 
-    def warn(self, message, context=None, error=None):
-        self.log("WARN", message, context, error)
+class BoundLogger:
+    """
+    Logger adding the bound fields to every log. The fields are serialized once, when bound, and merged
+    with the context of the execution once per execution.
+    """
 
-    def error(self, message, context=None, error=None):
-        self.log("ERROR", message, context, error)
+    def __init__(self, logger, fields, level_source=None):
+        self._logger = logger
+        # Logger providing the level, the named logger it was bound from or the logger itself
+        self._level_source = level_source or logger
+        self._fields = fields
+        self._fragment = serialize_fields(fields)
+        # Fragment of the context the merge was computed for, merged fields and merged fragment
+        self._merged = (None, None, None)
+
+    def bind(self, **fields):
+        return BoundLogger(self._logger, {**self._fields, **fields}, self._level_source)
+
+    def _merge(self, fields, fragment):
+        merged_for, merged_fields, merged_fragment = self._merged
+        if merged_for is not fragment:
+            merged_fields = {**fields, **self._fields}
+            if not fields.keys().isdisjoint(self._fields):
+                merged_fragment = serialize_fields(merged_fields)
+            elif fragment and self._fragment:
+                merged_fragment = f"{fragment}, {self._fragment}"
+            else:
+                merged_fragment = fragment or self._fragment
+            self._merged = (fragment, merged_fields, merged_fragment)
+        return merged_fields, merged_fragment
+
+    def is_enabled(self, level_name):
+        return self._logger.LEVELS[level_name] >= self._level_source._level
+
+    def log(self, level_name, message, context=None, error=None, args=None):
+        if self._logger.LEVELS[level_name] >= self._level_source._level:
+            self._logger._log(level_name, message, context, error, args, self)
+
+    def debug(self, message, context=None, error=None, args=None):
+        if self._level_source._level <= DEBUG:
+            self._logger._log("DEBUG", message, context, error, args, self)
+
+    def info(self, message, context=None, error=None, args=None):
+        if self._level_source._level <= INFO:
+            self._logger._log("INFO", message, context, error, args, self)
+
+    def warn(self, message, context=None, error=None, args=None):
+        if self._level_source._level <= WARN:
+            self._logger._log("WARN", message, context, error, args, self)
+
+    def error(self, message, context=None, error=None, args=None):
+        if self._level_source._level <= ERROR:
+            self._logger._log("ERROR", message, context, error, args, self)
+
+
+class NamedLogger(BoundLogger):
+    """
+    Logger with its own level, see Logger.get_logger(). The level is computed when the settings or the
+    level of the logger change, so checking it costs a single comparison.
+    """
+
+    def __init__(self, logger, name):
+        super().__init__(logger, {"logger": name})
+        self._level_source = self
+        self._level = logger._level
+        self.name = name
+
+    def debug(self, message, context=None, error=None, args=None):
+        if self._level <= DEBUG:
+            self._logger._log("DEBUG", message, context, error, args, self)
+
+    def info(self, message, context=None, error=None, args=None):
+        if self._level <= INFO:
+            self._logger._log("INFO", message, context, error, args, self)
+
+    def warn(self, message, context=None, error=None, args=None):
+        if self._level <= WARN:
+            self._logger._log("WARN", message, context, error, args, self)
+
+    def error(self, message, context=None, error=None, args=None):
+        if self._level <= ERROR:
+            self._logger._log("ERROR", message, context, error, args, self)
 
 
 logger = Logger()
+
+
+def get_logger(name):
+    return logger.get_logger(name)
@@ -0,0 +1,101 @@
+import os
+import threading
+import multiprocessing
+import lambda_powertools.prometheus as prometheus
+from lambda_powertools.config import Config
+from lambda_powertools.logger import logger
+from lambda_powertools.sink import drain
+
+
+def _run_worker(function, items, fields, level, connection):
+    # The records buffered by the parent are written by the parent, and its background writer doesn't run here
+    logger._sink = None
+    logger._aggregated = None
+    Config.override(OUTPUT_BACKGROUND_ENABLED=False)
+    logger.reset()
+    logger._level = level
+    logger.add_context(**fields)
+
+    # The metrics inherited from the parent are reset, so that only the changes made by the worker are sent back
+    prometheus.reset()
+
+    results = None
+    error = None
+    try:
+        results = [function(item) for item in items]
+    except Exception as e:
+        error = e
+
+    logger.close()
+
+    try:
+        connection.send((results, prometheus.get_deltas(), error))
+    except Exception as e:
+        # The error or the results can't be pickled
+        connection.send((None, prometheus.get_deltas(), RuntimeError(f"Worker failed: {error or e!r}")))
+    connection.close()
+
+
+def process_map(function, items, processes=None):
+    """
+    Returns [function(item) for item in items], computed by up to processes (default the number of CPUs)
+    forked processes, each one processing a contiguous chunk of the items.
+
+    The workers log with the context and the level of the caller, and the metrics they change are merged into
+    the global registry of the caller, so they are flushed by the PowerHandler. The results and the metrics are
+    sent back over pipes, because Lambda doesn't provide the shared memory required by multiprocessing.Pool.
+    If a worker raises, the error is raised once all the workers have completed.
+
+    It must be called from the main thread while no other thread is working (e.g. not from a batch_handler record
+    handler processing records concurrently): the workers are forked, and a lock held by another thread at that
+    moment is never released in the workers.
+    """
+    if threading.current_thread() is not threading.main_thread():
+        raise RuntimeError("process_map must be called from the main thread, forking while other threads run can deadlock the workers")
+
+    items = list(items)
+    if not items:
+        return []
+
+    processes = min(processes or os.cpu_count() or 1, len(items))
+    size, extra = divmod(len(items), processes)
+
+    fields, _ = logger._get_context()
+    context = multiprocessing.get_context("fork")
+
+    # The buffered logs are written before forking, so the workers' ones follow them, and the background writer
+    # is left idle, so it doesn't hold the stdout lock while forking
+    logger.flush()
+    drain()
+
+    workers = []
+    start = 0
+    for i in range(processes):
+        end = start + size + (1 if i < extra else 0)
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(target=_run_worker, args=(function, items[start:end], fields, logger._level, sender))
+        process.start()
+        sender.close()
+        workers.append((process, receiver))
+        start = end
+
+    results = []
+    error = None
+    for process, receiver in workers:
+        try:
+            worker_results, deltas, worker_error = receiver.recv()
+        except EOFError:
+            worker_results, deltas, worker_error = None, [], RuntimeError(f"Worker {process.pid} exited without results")
+        receiver.close()
+        process.join()
+
+        prometheus.merge_deltas(deltas)
+        if worker_error is not None:
+            error = error or worker_error
+        elif error is None:
+            results.extend(worker_results)
+
+    if error is not None:
+        raise error
+
+    return results
@@ -0,0 +1,81 @@
+import os
+import sys
+
+
+def get_rss_bytes():
+    """
+    Current resident memory of the process, or None where /proc is not available
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def get_peak_rss_bytes():
+    import resource
+    # Bytes on macOS, kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+
+class MemoryProfile:
+    """
+    Measures the resident memory growth of an execution and, with tracemalloc enabled, its top allocation sites
+    """
+
+    def __init__(self, tracemalloc_enabled=False, top=10):
+        self._tracemalloc_enabled = tracemalloc_enabled
+        self._top = top
+        self._started_tracing = False
+        self._start_snapshot = None
+        self._rss_before = None
+        self._peak_rss_before = None
+
+    def start(self):
+        self._rss_before = get_rss_bytes()
+        self._peak_rss_before = get_peak_rss_bytes()
+
+        if self._tracemalloc_enabled:
+            import tracemalloc
+            if tracemalloc.is_tracing():
+                # Already traced by someone else, whose peak is left untouched: only the allocations of the
+                # execution are reported
+                self._start_snapshot = tracemalloc.take_snapshot()
+            else:
+                tracemalloc.start()
+                self._started_tracing = True
+
+    def stop(self):
+        """
+        Returns the measures of the execution, as the context of a log
+        """
+        rss_after = get_rss_bytes()
+        peak_rss_after = get_peak_rss_bytes()
+
+        profile = {
+            "rss_bytes": rss_after,
+            "rss_delta_bytes": rss_after - self._rss_before if rss_after is not None and self._rss_before is not None else None,
+            "peak_rss_bytes": peak_rss_after,
+            "peak_rss_delta_bytes": peak_rss_after - self._peak_rss_before,
+        }
+
+        if self._tracemalloc_enabled:
+            import tracemalloc
+            snapshot = tracemalloc.take_snapshot().filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),))
+            if self._started_tracing:
+                # The peak is the one of the execution only when the tracing started with it
+                profile["traced_peak_bytes"] = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                allocations = [(stat, stat.size, stat.count) for stat in snapshot.statistics("lineno")]
+            else:
+                # The totals include the allocations made before the execution, only the differences are reported
+                allocations = [
+                    (stat, stat.size_diff, stat.count_diff) for stat in snapshot.compare_to(self._start_snapshot, "lineno")
+                ]
+            profile["top_allocations"] = [
+                {"site": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}", "size": size, "count": count}
+                for stat, size, count in allocations[:self._top]
+            ]
+
+        return profile
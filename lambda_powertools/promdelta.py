@@ -0,0 +1,156 @@
+"""
+Compact format of the metrics changed during an execution, written as a single log line:
+
+    PROMDELTA {"v":1,"c":"<container>","m":[...],"l":[...],"s":[...]}
+
+- "c" identifies the container (Python process) which wrote the line
+- "m" lists the metrics seen for the first time by the container: [id, name, type, documentation, labelnames, buckets]
+- "l" lists the label values seen for the first time by the container: [id, value, value, ...]
+- "s" lists the changed series: [metric id, label values id, values...] where the values are
+    + counter and gauge: [value]
+    + summary: [count, sum]
+    + histogram: [sum, bucket index, bucket count, bucket index, bucket count, ...] with the non empty buckets only
+
+Metrics and label values are sent only once per container, so the lines of a container must be decoded in order
+by the same Decoder.
+"""
+import json
+import uuid
+from prometheus_client.utils import floatToGoString
+
+PREFIX = "PROMDELTA "
+VERSION = 1
+
+
+def _number(value):
+    return int(value) if isinstance(value, float) and value.is_integer() else value
+
+
+class Encoder:
+
+    def __init__(self, container_id=None):
+        self._container_id = container_id or uuid.uuid4().hex
+        self._metric_ids = {}
+        self._label_values_ids = {}
+        # Ids are never reused, a forgotten id may still be in use by the decoder for other label values
+        self._next_label_values_id = 0
+
+    def _describe(self, metric_id, collector):
+        buckets = [floatToGoString(bound) for bound in getattr(collector, "_upper_bounds", [])]
+        return [metric_id, collector._name, collector._type, collector._documentation, list(collector._labelnames), buckets]
+
+    def _values(self, metric):
+        if metric._type == "histogram":
+            values = [_number(metric._sum.get())]
+            for index, bucket in enumerate(metric._buckets):
+                count = bucket.get()
+                if count:
+                    values += [index, _number(count)]
+            return values
+        if metric._type == "summary":
+            return [_number(metric._count.get()), _number(metric._sum.get())]
+        return [_number(metric._value.get())]
+
+    def forget_label_values(self, labelvalues):
+        """
+        Releases the id of the label values, which are sent again with a new id if used later
+        """
+        self._label_values_ids.pop(labelvalues, None)
+
+    def encode(self, touched):
+        """
+        Encodes the metrics returned by prometheus.get_touched_metrics(). Returns None if there are no metrics.
+        """
+        new_metrics = []
+        new_label_values = []
+        series = []
+
+        for collector, metrics in touched:
+            metric_id = self._metric_ids.get(collector)
+            if metric_id is None:
+                metric_id = self._metric_ids[collector] = len(self._metric_ids)
+                new_metrics.append(self._describe(metric_id, collector))
+
+            for metric in metrics:
+                label_values_id = self._label_values_ids.get(metric._labelvalues)
+                if label_values_id is None:
+                    label_values_id = self._label_values_ids[metric._labelvalues] = self._next_label_values_id
+                    self._next_label_values_id += 1
+                    new_label_values.append([label_values_id, *metric._labelvalues])
+
+                series.append([metric_id, label_values_id, *self._values(metric)])
+
+        if not series:
+            return None
+
+        payload = {"v": VERSION, "c": self._container_id}
+        if new_metrics:
+            payload["m"] = new_metrics
+        if new_label_values:
+            payload["l"] = new_label_values
+        payload["s"] = series
+
+        return PREFIX + json.dumps(payload, separators=(",", ":"))
+
+
+class Decoder:
+    """
+    Reference decoder of the PROMDELTA lines. It keeps the metrics and label values of each container.
+    """
+
+    def __init__(self):
+        self._containers = {}
+
+    def decode(self, line):
+        """
+        Returns the samples of the line as (name, labels, value) tuples, the same samples the Prometheus text
+        format would contain (e.g. histograms are expanded into cumulative _bucket, _count and _sum samples)
+        """
+        if line.startswith(PREFIX):
+            line = line[len(PREFIX):]
+
+        payload = json.loads(line)
+        if payload.get("v") != VERSION:
+            raise ValueError(f"Unsupported PROMDELTA version {payload.get('v')}")
+
+        container_id = payload["c"]
+        metrics, label_values = self._containers.setdefault(container_id, ({}, {}))
+        for metric_id, *metric in payload.get("m", []):
+            metrics[metric_id] = metric
+        for label_values_id, *values in payload.get("l", []):
+            label_values[label_values_id] = values
+
+        samples = []
+        for metric_id, label_values_id, *values in payload["s"]:
+            if metric_id not in metrics or label_values_id not in label_values:
+                raise ValueError(f"Unknown metric {metric_id} or label values {label_values_id} of container {container_id}")
+
+            name, metric_type, _, labelnames, buckets = metrics[metric_id]
+            labels = dict(zip(labelnames, label_values[label_values_id]))
+
+            if metric_type == "histogram":
+                counts = dict(zip(values[1::2], values[2::2]))
+                total = 0.0
+                for index, bound in enumerate(buckets):
+                    total += counts.get(index, 0)
+                    samples.append((f"{name}_bucket", {**labels, "le": bound}, total))
+                samples.append((f"{name}_count", labels, total))
+                samples.append((f"{name}_sum", labels, float(values[0])))
+            elif metric_type == "summary":
+                samples.append((f"{name}_count", labels, float(values[0])))
+                samples.append((f"{name}_sum", labels, float(values[1])))
+            elif metric_type == "counter":
+                samples.append((f"{name}_total", labels, float(values[0])))
+            else:
+                samples.append((name, labels, float(values[0])))
+
+        return samples
+
+    def describe(self, container_id, name):
+        """
+        Returns the (type, documentation) of a metric seen in the given container
+        """
+        for metric_name, metric_type, documentation, _, _ in self._containers.get(container_id, ({}, {}))[0].values():
+            if metric_name == name:
+                return metric_type, documentation
+        return None
@@ -1,72 +1,626 @@
 import os
+import abc
 import json
+import time
+from collections import OrderedDict
 import prometheus_client
-from prometheus_client import CollectorRegistry
+from prometheus_client import Counter, Gauge, Histogram, Summary
+from prometheus_client.metrics import MetricWrapperBase
+from lambda_powertools.config import Config
+from lambda_powertools.promdelta import Encoder
+from lambda_powertools import sink
+from lambda_powertools.logger import logger
 
 prometheus_client.disable_created_metrics()
 prometheus_client.REGISTRY.unregister(prometheus_client.GC_COLLECTOR)
 prometheus_client.REGISTRY.unregister(prometheus_client.PLATFORM_COLLECTOR)
 prometheus_client.REGISTRY.unregister(prometheus_client.PROCESS_COLLECTOR)
 
+SUPPORTED_TYPES = ("counter", "gauge", "histogram", "summary")
+
+GAUGE_MODES = ("last", "max", "sum")
+
+# Metrics (label-less collectors or labeled children) changed since the last reset, in order of first change.
+# A dict is used as an ordered set.
+_touched = {}
+
+# Values changed before this module was imported are not tracked, so the first reset scans the whole registry
+_full_reset_pending = True
+
+# Position of each collector in the global registry, used to export the metrics in registration order
+_collectors_order = {}
+
+# The compact format sends the metrics metadata only once per container, so the encoder is kept across executions
+_compact_encoder = Encoder()
+
+# Gauges, by name, not reporting the last value set during the execution
+_gauge_modes = {}
+
+# Number of the current execution, incremented on each reset
+_execution = 0
+
+# Labeled children with the collector they belong to and the last execution they were changed in, least recent first
+_series_by_last_change = OrderedDict()
+
+# Labeled children of each collector by label values, least recently changed first
+_collector_series = {}
+
+_series_evicted = Counter(
+    name="lambda_powertools_metric_series_evicted",
+    documentation="Number of labeled series removed because idle (idle) or because the series limit was reached (limit), "
+                  "and of new label sets merged into the overflow series (overflow)",
+    labelnames=["reason"]
+)
+_series_evicted_by_reason = {reason: _series_evicted.labels(reason) for reason in ("idle", "limit", "overflow")}
+
+_output_dropped = Counter(
+    name="lambda_powertools_output_dropped",
+    documentation="Number of outputs (log records, batches of buffered log records or metrics) dropped because the "
+                  "background writer queue was full"
+)
+_output_dropped_reported = 0
+
+_log_truncated = Counter(
+    name="lambda_powertools_log_truncated",
+    documentation="Number of logs having some field truncated because exceeding the configured size limits"
+)
+_log_truncated_reported = 0
+
+_handler_duration = Histogram(
+    name="lambda_powertools_handler_duration_seconds",
+    documentation="Duration of the handler wrapped by the PowerHandler"
+)
+
+_cold_start = Gauge(
+    name="lambda_powertools_cold_start",
+    documentation="1 if the execution is the first one of the container, 0 otherwise"
+)
+
+_overhead = Histogram(
+    name="lambda_powertools_overhead_seconds",
+    documentation="Duration of the work done by the PowerHandler around the handler, by phase: capture of the "
+                  "logger context (capture), reset of the metrics (reset), flush of logs and metrics (flush)",
+    labelnames=["phase"],
+    buckets=(0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, float("inf"))
+)
+_overhead_by_phase = {phase: _overhead.labels(phase) for phase in ("capture", "reset", "flush")}
+
+_memory_rss = Gauge(
+    name="lambda_powertools_memory_rss_bytes",
+    documentation="Resident memory of the container at the end of a profiled execution"
+)
+
+_memory_peak_rss_delta = Gauge(
+    name="lambda_powertools_memory_peak_rss_delta_bytes",
+    documentation="Growth of the peak resident memory of the container during a profiled execution"
+)
+
+_memory_traced_peak = Gauge(
+    name="lambda_powertools_memory_traced_peak_bytes",
+    documentation="Peak memory allocated during a profiled execution, as traced by tracemalloc"
+)
+
+
+def _restore_series(metric):
+    """
+    Puts back into its collector an evicted series still referenced and changed by the caller, so that the change
+    is not lost. Returns the series to change: the evicted one, or the one created for the same labels meanwhile.
+    """
+    collector = metric._evicted_from
+    metric._evicted_from = None
+    with collector._lock:
+        series = collector._metrics.setdefault(metric._labelvalues, metric)
+    if series is metric and _is_series_bounded():
+        _record_series_change(collector, metric)
+    return series
+
+
+def _track(method):
+    def tracked(self, *args, **kwargs):
+        if self._evicted_from is not None:
+            self = _restore_series(self)
+        result = method(self, *args, **kwargs)
+        _touched[self] = None
+        return result
+
+    tracked.__wrapped__ = method
+    return tracked
+
+
+def _track_gauge_set(method):
+    def set(self, value):
+        if self._evicted_from is not None:
+            self = _restore_series(self)
+        mode = _gauge_modes.get(self._name)
+        if mode is not None and self in _touched:
+            if mode == "max":
+                value = max(self._value.get(), float(value))
+            elif mode == "sum":
+                value = self._value.get() + float(value)
+        method(self, value)
+        _touched[self] = None
+
+    set.__wrapped__ = method
+    return set
+
+
+def set_gauge_mode(gauge, mode):
+    """
+    Sets the value reported by the gauge when it's set multiple times during an execution:
+    the last value set (last, default), the max value set (max) or the sum of the values set (sum)
+    """
+    if mode not in GAUGE_MODES:
+        raise ValueError(f"Invalid gauge mode {mode}")
+
+    if mode == "last":
+        _gauge_modes.pop(gauge._name, None)
+    else:
+        _gauge_modes[gauge._name] = mode
+
+
+def _get_labels_key(collector, labelvalues, labelkwargs):
+    """
+    Same conversion applied by MetricWrapperBase.labels(), returns None if the labels are not valid
+    """
+    if labelkwargs:
+        if labelvalues or sorted(labelkwargs) != sorted(collector._labelnames):
+            return None
+        return tuple(str(labelkwargs[name]) for name in collector._labelnames)
+    if len(labelvalues) != len(collector._labelnames):
+        return None
+    return tuple(str(value) for value in labelvalues)
+
+
+def _bound(method):
+    def labels(self, *labelvalues, **labelkwargs):
+        # Only the labeled collectors of the global registry are bounded, the others are not reset nor exported
+        if (
+            not self._labelnames or self._labelvalues or self is _series_evicted or not _is_series_bounded()
+            or prometheus_client.REGISTRY._names_to_collectors.get(self._name) is not self
+        ):
+            return method(self, *labelvalues, **labelkwargs)
+
+        key = _get_labels_key(self, labelvalues, labelkwargs)
+        if key is None or key in self._metrics:
+            return method(self, *labelvalues, **labelkwargs)
+
+        max_series = Config.METRICS_MAX_SERIES
+        if max_series and len(self._metrics) >= max_series and not _evict_least_recent(self):
+            _series_evicted_by_reason["overflow"].inc()
+            key = (Config.METRICS_OVERFLOW_LABEL_VALUE,) * len(self._labelnames)
+            if key in self._metrics:
+                return method(self, *key)
+            labelvalues, labelkwargs = key, {}
+
+        metric = method(self, *labelvalues, **labelkwargs)
+        _record_series_change(self, metric)
+        return metric
+
+    labels.__wrapped__ = method
+    return labels
+
+
+def _install_tracking():
+    # Collector the series was evicted from, set on the evicted series only
+    MetricWrapperBase._evicted_from = None
+
+    for metric_class, method_names in (
+        (Counter, ("inc",)),
+        (Gauge, ("inc", "dec")),
+        (Histogram, ("observe",)),
+        (Summary, ("observe",)),
+    ):
+        for method_name in method_names:
+            method = getattr(metric_class, method_name)
+            if not hasattr(method, "__wrapped__"):
+                setattr(metric_class, method_name, _track(method))
+
+    if not hasattr(Gauge.set, "__wrapped__"):
+        Gauge.set = _track_gauge_set(Gauge.set)
+
+    if not hasattr(MetricWrapperBase.labels, "__wrapped__"):
+        MetricWrapperBase.labels = _bound(MetricWrapperBase.labels)
+
+
+_install_tracking()
+
+
+def _get_collector(metric):
+    """
+    Returns the collector registered in the global registry the metric belongs to, if any
+    """
+    collector = prometheus_client.REGISTRY._names_to_collectors.get(metric._name)
+    if collector is metric:
+        return collector
+    if metric._labelvalues and getattr(collector, "_metrics", {}).get(metric._labelvalues) is metric:
+        return collector
+    return None
+
+
+def _get_collector_position(collector):
+    global _collectors_order
+
+    if collector not in _collectors_order:
+        _collectors_order = {c: i for i, c in enumerate(prometheus_client.REGISTRY._collector_to_names)}
+    return _collectors_order[collector]
+
+
+def _is_series_bounded():
+    return Config.METRICS_MAX_SERIES > 0 or Config.METRICS_SERIES_MAX_IDLE > 0
+
+
+def _record_series_change(collector, metric):
+    if collector is _series_evicted:
+        return
+
+    _series_by_last_change[metric] = (collector, _execution)
+    _series_by_last_change.move_to_end(metric)
+
+    series = _collector_series.setdefault(collector, OrderedDict())
+    series[metric._labelvalues] = metric
+    series.move_to_end(metric._labelvalues)
+
+
+def _evict_series(collector, metric, reason):
+    with collector._lock:
+        if collector._metrics.get(metric._labelvalues) is metric:
+            del collector._metrics[metric._labelvalues]
+            metric._evicted_from = collector
+
+    _series_by_last_change.pop(metric, None)
+    _collector_series.get(collector, {}).pop(metric._labelvalues, None)
+    _compact_encoder.forget_label_values(metric._labelvalues)
+    _series_evicted_by_reason[reason].inc()
+
+
+def _evict_least_recent(collector):
+    """
+    Evicts the least recently changed series of the collector not changed in the current execution, if any
+    """
+    for metric in _collector_series.get(collector, {}).values():
+        if metric not in _touched:
+            _evict_series(collector, metric, "limit")
+            return True
+    return False
+
+
+def _evict_idle_series():
+    max_idle = Config.METRICS_SERIES_MAX_IDLE
+    while _series_by_last_change:
+        metric, (collector, execution) = next(iter(_series_by_last_change.items()))
+        if _execution - execution <= max_idle:
+            break
+        _evict_series(collector, metric, "idle")
+
+
+def _reset_metric(metric):
+    if isinstance(metric, (Counter, Gauge)):
+        metric._value.set(0)
+    elif isinstance(metric, Histogram):
+        metric._sum.set(0)
+        for bucket in metric._buckets:
+            bucket.set(0)
+    elif isinstance(metric, Summary):
+        metric._count.set(0)
+        metric._sum.set(0)
+
+
+def _is_empty(metric):
+    if isinstance(metric, (Counter, Gauge)):
+        return metric._value.get() == 0
+    if isinstance(metric, Histogram):
+        return metric._sum.get() == 0 and all(bucket.get() == 0 for bucket in metric._buckets)
+    if isinstance(metric, Summary):
+        return metric._count.get() == 0
+    return True
+
+
+def _get_all_metrics():
+    for collector in list(prometheus_client.REGISTRY._collector_to_names):
+        if not isinstance(collector, MetricWrapperBase):
+            continue
+        if collector._is_parent():
+            yield from list(collector._metrics.values())
+        else:
+            yield collector
+
 
 def reset():
-    for collector in prometheus_client.REGISTRY._collector_to_names:
-        if "_value" in dir(collector):
-            # case Counter without labels
-            collector._value.set(0)
-        elif "_metrics" in dir(collector):
-            for metric in collector._metrics.values():
-                if "_value" in dir(metric):
-                    # case Counter with labels
-                    metric._value.set(0)
-                elif "_buckets" in dir(metric) and "_sum" in dir(metric):
-                    # case Histogram with labels
-                    metric._sum.set(0)
-                    for bucket in metric._buckets:
-                        bucket.set(0)
-        elif "_buckets" in dir(collector) and "_sum" in dir(collector):
-            # case Histogram without labels
-            collector._sum.set(0)
-            for bucket in collector._buckets:
-                bucket.set(0)
+    global _full_reset_pending, _execution
+
+    bounded = _is_series_bounded()
+
+    if _full_reset_pending:
+        for metric in _get_all_metrics():
+            _reset_metric(metric)
+            if bounded and metric._labelvalues:
+                _record_series_change(_get_collector(metric), metric)
+        _full_reset_pending = False
+    else:
+        for metric in list(_touched):
+            collector = _get_collector(metric)
+            if collector is not None:
+                _reset_metric(metric)
+                if bounded and metric._labelvalues:
+                    _record_series_change(collector, metric)
+
+    _touched.clear()
+    _execution += 1
+
+    # Evicted series are counted after the reset, so the counter is exported with the metrics of this execution
+    if Config.METRICS_SERIES_MAX_IDLE > 0:
+        _evict_idle_series()
 
 
 def filter_metrics(m):
     # Other metric types are not supported so far
-    if m._type not in ("counter", "histogram"):
+    if getattr(m, "_type", None) not in SUPPORTED_TYPES:
         return False
 
     # Empty metrics with labels are exported without values
-    dir_m = dir(m)
-    if "_value" in dir_m and m._value._value == 0:
-        return False
-    if "_buckets" in dir_m and m._sum._value == 0:
-        return False
-    if "_metrics" in dir_m:
-        for metric in m._metrics.values():
-            if ("_value" in dir(metric) and metric._value._value > 0) or ("_sum" in dir(metric) and metric._sum._value > 0):
-                return True
-        return False
+    if m._is_parent():
+        return any(not _is_empty(metric) for metric in list(m._metrics.values()))
 
-    return True
+    return not _is_empty(m)
+
+
+def get_touched_metrics():
+    """
+    Returns the collectors changed since the last reset, each with the list of its changed and not empty
+    metrics (the collector itself when it has no labels), in registration order
+    """
+    # Until the first reset the changes are not fully tracked, so all the metrics are candidates
+    candidates = _get_all_metrics() if _full_reset_pending else list(_touched)
+
+    touched = {}
+    for metric in candidates:
+        if metric._type not in SUPPORTED_TYPES:
+            continue
+        # A gauge changed during the execution is exported even when zero, because it's still a meaningful value
+        if (_full_reset_pending or metric._type != "gauge") and _is_empty(metric):
+            continue
+        collector = _get_collector(metric)
+        if collector is not None:
+            touched.setdefault(collector, []).append(metric)
+
+    return sorted(touched.items(), key=lambda item: _get_collector_position(item[0]))
+
+
+def _collect_touched(collector, metrics):
+    """
+    Same as collector.collect(), but limited to the given metrics instead of all the labeled children
+    """
+    family = collector._get_metric()
+    for metric in metrics:
+        series_labels = list(zip(collector._labelnames, metric._labelvalues))
+        for suffix, labels, value, timestamp, exemplar, native_histogram in metric._child_samples():
+            family.add_sample(collector._name + suffix, dict(series_labels + list(labels.items())), value, timestamp, exemplar, native_histogram)
+    return family
+
+
+class _CollectedMetrics:
+
+    def __init__(self, families):
+        self._families = families
+
+    def collect(self):
+        return self._families
 
 
 def get_metrics():
-    new_registry = CollectorRegistry(auto_describe=True)
+    families = [_collect_touched(collector, metrics) for collector, metrics in get_touched_metrics()]
+    return prometheus_client.generate_latest(_CollectedMetrics(families)).decode("utf-8")
 
-    for collector in filter(filter_metrics, prometheus_client.REGISTRY._collector_to_names):
-        new_registry.register(collector)
 
-    return prometheus_client.generate_latest(new_registry).decode("utf-8")
+def get_deltas():
+    """
+    Returns the values of the series changed since the last reset, as picklable tuples
+    (name, label values, values), to be merged into the registry of another process with merge_deltas()
+    """
+    deltas = []
+    for collector, metrics in get_touched_metrics():
+        for metric in metrics:
+            if collector._type in ("counter", "gauge"):
+                values = (metric._value.get(),)
+            elif collector._type == "histogram":
+                values = (metric._sum.get(), *[bucket.get() for bucket in metric._buckets])
+            else:
+                values = (metric._count.get(), metric._sum.get())
+            deltas.append((collector._name, metric._labelvalues, values))
+    return deltas
 
 
-def flush_metrics():
-    metrics = get_metrics()
+def merge_deltas(deltas):
+    """
+    Adds the values returned by get_deltas() to the series of the global registry. Gauges are set to the
+    value, according to their mode.
+    """
+    for name, labelvalues, values in deltas:
+        collector = prometheus_client.REGISTRY._names_to_collectors.get(name)
+        if collector is None:
+            continue
+        metric = collector.labels(*labelvalues) if labelvalues else collector
 
-    if not metrics or len(metrics) == 0:
-        return
+        if collector._type == "counter":
+            metric.inc(values[0])
+        elif collector._type == "gauge":
+            metric.set(values[0])
+        elif collector._type == "histogram":
+            metric._sum.inc(values[0])
+            for bucket, count in zip(metric._buckets, values[1:]):
+                bucket.inc(count)
+            _touched[metric] = None
+        elif collector._type == "summary":
+            metric._count.inc(values[0])
+            metric._sum.inc(values[1])
+            _touched[metric] = None
+
+
+class Exporter(abc.ABC):
+    """
+    Formats the metrics changed during an execution into the lines written to the logs
+    """
+
+    @abc.abstractmethod
+    def export(self, touched):
+        """
+        Returns the lines for the collectors changed since the last reset, as returned by get_touched_metrics()
+        """
+
+
+class PromlogExporter(Exporter):
+    """
+    Prometheus text format, as a JSON string in a PROMLOG [...] line
+    """
+
+    def export(self, touched):
+        if not touched:
+            return []
+        families = [_collect_touched(collector, metrics) for collector, metrics in touched]
+        metrics = prometheus_client.generate_latest(_CollectedMetrics(families)).decode("utf-8")
+        return ["PROMLOG [" + json.dumps(metrics) + "]"]
+
+
+class CompactExporter(Exporter):
+    """
+    PROMDELTA line, see lambda_powertools.promdelta
+    """
+
+    def export(self, touched):
+        line = _compact_encoder.encode(touched)
+        return [line] if line is not None else []
+
+
+class EmfExporter(Exporter):
+    """
+    CloudWatch Embedded Metric Format. The series with the same labels are grouped in the same document, up to
+    MAX_METRICS per document, with the labels as dimensions (up to MAX_DIMENSIONS, the others are added as
+    properties). Histograms and summaries are exported as their _count and _sum, without buckets.
+    """
+    MAX_METRICS = 100
+    MAX_DIMENSIONS = 30
+
+    def export(self, touched):
+        # Metrics definitions and values by label set
+        groups = {}
+        for collector, metrics in touched:
+            for metric in metrics:
+                labels = tuple(zip(collector._labelnames, metric._labelvalues))
+                group = groups.setdefault(labels, ([], {}))
+                for suffix, sample_labels, value, _, _, _ in metric._child_samples():
+                    if suffix == "_bucket" or sample_labels:
+                        continue
+                    name = collector._name + suffix
+                    unit = "Count" if collector._type == "counter" or suffix == "_count" else "None"
+                    group[0].append({"Name": name, "Unit": unit})
+                    group[1][name] = value
+
+        timestamp = int(time.time() * 1000)
+        lines = []
+        for labels, (definitions, values) in groups.items():
+            dimensions = [name for name, _ in labels[:self.MAX_DIMENSIONS]]
+            for i in range(0, len(definitions), self.MAX_METRICS):
+                chunk = definitions[i:i + self.MAX_METRICS]
+                document = {
+                    "_aws": {
+                        "Timestamp": timestamp,
+                        "CloudWatchMetrics": [{
+                            "Namespace": Config.METRICS_EMF_NAMESPACE,
+                            "Dimensions": [dimensions],
+                            "Metrics": chunk,
+                        }],
+                    },
+                    **dict(labels),
+                    **{definition["Name"]: values[definition["Name"]] for definition in chunk},
+                }
+                lines.append(json.dumps(document))
+        return lines
+
+
+_exporters = {
+    "promlog": PromlogExporter(),
+    "compact": CompactExporter(),
+    "emf": EmfExporter(),
+}
+
+
+# Unknown metrics formats already reported
+_unknown_formats = set()
+
+
+def register_exporter(name, exporter):
+    """
+    Registers an exporter, selected setting METRICS_FORMAT to its name
+    """
+    _exporters[name.lower()] = exporter
+
+
+def get_exporter():
+    """
+    Returns the exporter selected by METRICS_FORMAT. An unknown format falls back to promlog, so that a
+    misconfiguration doesn't fail the executions, and is reported once
+    """
+    exporter = _exporters.get(Config.METRICS_FORMAT)
+    if exporter is None:
+        if Config.METRICS_FORMAT not in _unknown_formats:
+            _unknown_formats.add(Config.METRICS_FORMAT)
+            logger.warn("Unknown metrics format, falling back to promlog", {"metrics_format": Config.METRICS_FORMAT})
+            # The logs of the execution have already been flushed
+            logger.flush()
+        exporter = _exporters["promlog"]
+    return exporter
+
+
+def _count_output_dropped():
+    global _output_dropped_reported
+
+    writer = sink.get_background_writer()
+    if writer.dropped > _output_dropped_reported:
+        _output_dropped.inc(writer.dropped - _output_dropped_reported)
+        _output_dropped_reported = writer.dropped
+
+
+def record_execution(cold_start, capture_ns, reset_ns, handler_ns, flush_ns=None):
+    """
+    Records the instrumentation metrics of an execution of the PowerHandler, with the durations in ns
+    """
+    _cold_start.set(1 if cold_start else 0)
+    _handler_duration.observe(handler_ns / 1e9)
+    _overhead_by_phase["capture"].observe(capture_ns / 1e9)
+    _overhead_by_phase["reset"].observe(reset_ns / 1e9)
+    if flush_ns is not None:
+        _overhead_by_phase["flush"].observe(flush_ns / 1e9)
+
+
+def _count_log_truncated():
+    global _log_truncated_reported
+
+    # The counter of the logger starts again from zero when the logger is initialized again
+    if logger.truncated < _log_truncated_reported:
+        _log_truncated_reported = 0
+    if logger.truncated > _log_truncated_reported:
+        _log_truncated.inc(logger.truncated - _log_truncated_reported)
+        _log_truncated_reported = logger.truncated
+
+
+def record_memory_profile(profile):
+    """
+    Records the gauges of a memory profile, see lambda_powertools.profiling
+    """
+    if profile.get("rss_bytes") is not None:
+        _memory_rss.set(profile["rss_bytes"])
+    _memory_peak_rss_delta.set(profile["peak_rss_delta_bytes"])
+    if "traced_peak_bytes" in profile:
+        _memory_traced_peak.set(profile["traced_peak_bytes"])
+
+
+def flush_metrics():
+    if Config.OUTPUT_BACKGROUND_ENABLED:
+        _count_output_dropped()
+    _count_log_truncated()
 
     if os.environ.get("PYTEST_CURRENT_TEST"):
         return
 
-    print("PROMLOG [" + json.dumps(metrics) + "]")
+    for line in get_exporter().export(get_touched_metrics()):
+        sink.write_line(line)
@@ -1,24 +1,124 @@
 import os
-import lambda_powertools.prometheus as prometheus
+import sys
+import time
+import lambda_powertools.sink as sink
+from lambda_powertools.config import Config
 from lambda_powertools.logger import logger
 
+# Event loop running the async handlers, kept across executions so that connections pools and other resources
+# bound to it survive between invocations of a warm container
+_event_loop = None
+
+# lambda_powertools.prometheus, imported on first use
+_prometheus = None
+
+_cold_start = True
+
+# Duration of the flush of the previous execution: the metrics are already written when it's known,
+# so it's exported with the metrics of the following execution
+_pending_flush_ns = None
+
+
+def get_event_loop():
+    global _event_loop
+
+    import asyncio
+
+    if _event_loop is None or _event_loop.is_closed():
+        _event_loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(_event_loop)
+
+    return _event_loop
+
+
+def get_prometheus(required=False):
+    """
+    Returns lambda_powertools.prometheus, or None if prometheus_client was never imported (and it's not required):
+    no metric can exist, so a function that only logs doesn't pay for the initialization of the metrics
+    """
+    global _prometheus
+
+    if _prometheus is None and (required or "prometheus_client" in sys.modules or Config.INSTRUMENTATION_ENABLED):
+        import lambda_powertools.prometheus as prometheus
+        _prometheus = prometheus
+
+    return _prometheus
+
+
+def _is_memory_profile_requested(event):
+    headers = event.get("headers") if isinstance(event, dict) else None
+    return bool(headers) and headers.get("x-profile-memory") == "true"
+
+
+def _start_memory_profile():
+    # Imported on first use, the profiling costs nothing when not enabled
+    from lambda_powertools import profiling
+
+    memory_profile = profiling.MemoryProfile(Config.MEMORY_PROFILING_TRACEMALLOC, Config.MEMORY_PROFILING_TOP)
+    memory_profile.start()
+    return memory_profile
+
+
+def _stop_memory_profile(memory_profile):
+    profile = memory_profile.stop()
+    get_prometheus(required=True).record_memory_profile(profile)
+    logger.report("Memory profile", profile)
+
 
 def power_handler(wrapped_handler):
 
     def wrapper(event, context):
+        global _cold_start, _pending_flush_ns
+
+        cold_start = _cold_start
+        _cold_start = False
+
+        start_ns = time.perf_counter_ns()
         logger.reset()
         logger.capture(env=os.environ, event=event, context=context)
+        captured_ns = time.perf_counter_ns()
+
+        prometheus = get_prometheus()
+        if prometheus is not None:
+            prometheus.reset()
+        reset_ns = time.perf_counter_ns()
 
-        prometheus.reset()
+        memory_profile = None
+        if Config.MEMORY_PROFILING_ENABLED or _is_memory_profile_requested(event):
+            memory_profile = _start_memory_profile()
 
         response = None
         error = None
         try:
             response = wrapped_handler(event, context)
+            if hasattr(response, "__await__"):
+                response = get_event_loop().run_until_complete(response)
         except Exception as e:
             error = e
+        handled_ns = time.perf_counter_ns()
+
+        if memory_profile is not None:
+            _stop_memory_profile(memory_profile)
+
+        instrumented = Config.INSTRUMENTATION_ENABLED
+        if instrumented:
+            prometheus = get_prometheus()
+            prometheus.record_execution(
+                cold_start, captured_ns - start_ns, reset_ns - captured_ns, handled_ns - reset_ns, _pending_flush_ns
+            )
+
+        logger.close()
+
+        # prometheus_client may have been imported by the handler itself
+        prometheus = get_prometheus()
+        if prometheus is not None:
+            prometheus.flush_metrics()
+
+        # The container can be frozen as soon as the handler returns, the output written in background must be completed
+        sink.drain()
 
-        prometheus.flush_metrics()
+        if instrumented:
+            _pending_flush_ns = time.perf_counter_ns() - handled_ns
 
         if error is not None:
             raise error
@@ -0,0 +1,150 @@
+import queue
+import threading
+from lambda_powertools.config import Config
+
+# Shared by the logger and the metrics, created on first use
+_background_writer = None
+
+
+class BackgroundWriter:
+    """
+    Writes the output to stdout from a daemon thread, so that slow writes don't block the caller.
+    When the queue is full, the output is dropped or the caller blocks, depending on the policy.
+    """
+
+    def __init__(self, max_size, block):
+        self._queue = queue.Queue(maxsize=max_size)
+        self._block = block
+        self._thread = None
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="lambda-powertools-writer", daemon=True)
+                self._thread.start()
+
+    def write(self, output):
+        if self._thread is None or not self._thread.is_alive():
+            self._start()
+
+        try:
+            self._queue.put(output, block=self._block)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+
+    def drain(self):
+        """
+        Blocks until all the queued output has been written
+        """
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            outputs = [self._queue.get()]
+            while True:
+                try:
+                    outputs.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            try:
+                print("".join(outputs), end="", flush=True)
+            except Exception:
+                # Nowhere to report the failure, the output is lost
+                pass
+            finally:
+                for _ in outputs:
+                    self._queue.task_done()
+
+
+def get_background_writer():
+    global _background_writer
+
+    if _background_writer is None:
+        _background_writer = BackgroundWriter(
+            max_size=Config.OUTPUT_QUEUE_SIZE,
+            block=Config.OUTPUT_QUEUE_FULL_POLICY != "drop"
+        )
+    return _background_writer
+
+
+def write_line(line):
+    """
+    Writes the line to stdout, in background if enabled
+    """
+    if Config.OUTPUT_BACKGROUND_ENABLED:
+        get_background_writer().write(f"{line}\n")
+    else:
+        print(line)
+
+
+def drain():
+    if _background_writer is not None:
+        _background_writer.drain()
+
+
+class StdoutSink:
+
+    def write(self, record):
+        print(f"{record}\n")
+
+    def flush(self):
+        pass
+
+
+class BackgroundSink:
+
+    def __init__(self, writer):
+        self._writer = writer
+
+    def write(self, record):
+        self._writer.write(f"{record}\n\n")
+
+    def flush(self):
+        pass
+
+
+class BufferedSink:
+    """
+    Collects the serialized records in memory and writes them to stdout with a single call,
+    either when explicitly flushed or as soon as one of the thresholds is reached.
+    It can be used by multiple threads.
+    """
+
+    def __init__(self, max_records, max_bytes, writer=None):
+        self._max_records = max_records
+        self._max_bytes = max_bytes
+        self._writer = writer
+        self._records = []
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def write(self, record):
+        # Same layout produced by the StdoutSink, so the output doesn't change when buffering
+        record = f"{record}\n\n"
+        with self._lock:
+            self._records.append(record)
+            self._size += len(record)
+
+            if len(self._records) >= self._max_records or self._size >= self._max_bytes:
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._records:
+            return
+
+        output = "".join(self._records)
+        self._records = []
+        self._size = 0
+
+        if self._writer is not None:
+            self._writer.write(output)
+        else:
+            print(output, end="")
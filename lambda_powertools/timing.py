@@ -0,0 +1,100 @@
+import time
+import inspect
+import functools
+from lambda_powertools.config import Config
+
+OUTCOMES = ("success", "failure")
+
+def _get_children(metric, children, labels):
+    """
+    Returns the children of the metric by outcome, looking them up again when the given ones are not valid anymore
+    """
+    # The children are not valid anymore if removed from the metric, e.g. evicted because of the series limits
+    if children is None or (metric._labelnames and any(metric._metrics.get(child._labelvalues) is not child for child in children)):
+        if "outcome" in metric._labelnames:
+            children = tuple(metric.labels(**labels, outcome=outcome) for outcome in OUTCOMES)
+        else:
+            child = metric.labels(**labels) if metric._labelnames else metric
+            children = (child, child)
+    return children
+
+
+class timed:
+    """
+    Observes the duration in seconds of a block or of the calls of a function into a histogram or a summary,
+    labeled by outcome (success, or failure if it raises) when the metric has an "outcome" label. The other
+    labels of the metric are given as keyword arguments.
+
+        with timed(duration, operation="fetch"):
+            ...
+
+        @timed(duration, operation="fetch")
+        def fetch():
+            ...
+
+    Nothing is measured when METRICS_TIMING_ENABLED is false. The labeled children are looked up once per
+    decorated function or timed instance, so they are not kept when the instance is discarded.
+    """
+
+    __slots__ = ("_metric", "_labels", "_children", "_start_ns")
+
+    def __init__(self, metric, **labels):
+        self._metric = metric
+        self._labels = labels
+        self._children = None
+        self._start_ns = None
+
+    def __enter__(self):
+        if Config.METRICS_TIMING_ENABLED:
+            self._start_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        if self._start_ns is not None:
+            elapsed_ns = time.perf_counter_ns() - self._start_ns
+            self._start_ns = None
+            self._children = _get_children(self._metric, self._children, self._labels)
+            success, failure = self._children
+            (success if exc_type is None else failure).observe(elapsed_ns / 1e9)
+        return False
+
+    def __call__(self, function):
+        metric = self._metric
+        labels = self._labels
+        children = None
+
+        def observe(index, elapsed_ns):
+            nonlocal children
+            children = _get_children(metric, children, labels)
+            children[index].observe(elapsed_ns / 1e9)
+
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def timed_async(*args, **kwargs):
+                if not Config.METRICS_TIMING_ENABLED:
+                    return await function(*args, **kwargs)
+                start_ns = time.perf_counter_ns()
+                try:
+                    result = await function(*args, **kwargs)
+                except BaseException:
+                    observe(1, time.perf_counter_ns() - start_ns)
+                    raise
+                observe(0, time.perf_counter_ns() - start_ns)
+                return result
+
+            return timed_async
+
+        @functools.wraps(function)
+        def timed_function(*args, **kwargs):
+            if not Config.METRICS_TIMING_ENABLED:
+                return function(*args, **kwargs)
+            start_ns = time.perf_counter_ns()
+            try:
+                result = function(*args, **kwargs)
+            except BaseException:
+                observe(1, time.perf_counter_ns() - start_ns)
+                raise
+            observe(0, time.perf_counter_ns() - start_ns)
+            return result
+
+        return timed_function
@@ -1,5 +1,11 @@
 import json
 import math
+import zlib
+import time
+import threading
+from json.encoder import encode_basestring_ascii
+
+_json_dumps = json.dumps
 
 
 def parse_bool(value, default_value):
@@ -11,19 +17,321 @@ def parse_bool(value, default_value):
     return default_value
 
 
-def serialize_log(log):
-    response = log.copy()
+def parse_int(value, default_value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default_value
+
+
+def parse_float(value, default_value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default_value
+
+
+def parse_levels(value):
+    """
+    Parses "name=LEVEL,name=LEVEL" into a dict, skipping the entries with an unknown level
+    """
+    levels = {}
+    for entry in (value or "").split(","):
+        name, _, level_name = entry.partition("=")
+        level_name = level_name.strip().upper()
+        if name.strip() and level_name in ("DEBUG", "INFO", "WARN", "ERROR"):
+            levels[name.strip()] = level_name
+    return levels
+
+
+def set_json_backend(dumps):
+    """
+    Set the function used to encode nested lists and dicts (e.g. a faster JSON library).
+    It must produce the same output of json.dumps, otherwise the log format changes.
+    Passing None restores the default one.
+    """
+    global _json_dumps
+    _json_dumps = dumps or json.dumps
+
+
+def serialize_key(key):
+    if isinstance(key, str):
+        return encode_basestring_ascii(key)
+    # Same conversion applied by json.dumps to int, float, bool and None keys
+    return '"' + json.dumps(key) + '"'
+
+
+def serialize_value(value):
+    value_type = type(value)
+
+    if value is None:
+        return "null"
+    if value_type is str:
+        return encode_basestring_ascii(value)
+    if value_type is bool:
+        return "true" if value else "false"
+    if value_type is int:
+        return int.__repr__(value)
+    if value_type is float:
+        return float.__repr__(value) if math.isfinite(value) else "null"
+    if isinstance(value, str):
+        return encode_basestring_ascii(value)
+    if isinstance(value, (list, dict)):
+        # Nested objects are logged as JSON strings
+        return encode_basestring_ascii(_json_dumps(value))
+    if isinstance(value, float):
+        return float.__repr__(value) if math.isfinite(value) else "null"
+    return json.dumps(value)
+
+
+def serialize_fields(fields):
+    """
+    Serialize the fields into a JSON object fragment, without the surrounding braces, so that
+    it can be computed once and reused as prefix of multiple logs
+    """
+    return ", ".join([f"{serialize_key(key)}: {serialize_value(value)}" for key, value in fields.items()])
+
+
+def serialize_log(log, prefix=None):
+    fields = serialize_fields(log)
+
+    if prefix:
+        fields = f"{prefix}, {fields}" if fields else prefix
+
+    return "{" + fields + "}"
+
+
+TRUNCATION_MARKER = "...[truncated]"
+
+# Added to the logs having some field truncated
+TRUNCATION_FIELD = '"log_truncated": true'
+
+_iterative_encoder = json.JSONEncoder()
+
+
+def _truncate_encoded(encoded, max_bytes):
+    """
+    Cuts a serialized string to max_bytes, marker included, without splitting its escape sequences
+    """
+    cut = encoded[1:1 + max(max_bytes - 2 - len(TRUNCATION_MARKER), 0)]
+
+    backslash = cut.rfind("\\", max(len(cut) - 6, 0))
+    if backslash >= 0:
+        escaped = cut[:backslash + 1]
+        # An odd number of backslashes starts an escape sequence, which may have been cut
+        if (len(escaped) - len(escaped.rstrip("\\"))) % 2 == 1:
+            length = 6 if cut[backslash + 1:backslash + 2] == "u" else 2
+            if backslash + length > len(cut):
+                cut = cut[:backslash]
+
+    return '"' + cut + TRUNCATION_MARKER + '"'
+
+
+def serialize_value_limited(value, max_bytes):
+    """
+    Same as serialize_value(), but strings and nested objects longer than max_bytes are truncated, and only
+    encoded up to the limit. Returns the serialized value and whether it was truncated.
+    """
+    if isinstance(value, str):
+        # Each character is encoded in one byte at least
+        encoded = encode_basestring_ascii(value[:max_bytes])
+    elif isinstance(value, (list, dict)):
+        chunks = []
+        size = 0
+        for chunk in _iterative_encoder.iterencode(value):
+            chunks.append(chunk)
+            size += len(chunk)
+            if size > max_bytes:
+                break
+        encoded = encode_basestring_ascii("".join(chunks))
+    else:
+        return serialize_value(value), False
+
+    if len(encoded) <= max_bytes:
+        return encoded, False
+    return _truncate_encoded(encoded, max_bytes), True
+
+
+def serialize_log_limited(log, prefix=None, max_field_bytes=0, max_record_bytes=0):
+    """
+    Same as serialize_log(), but the fields are truncated to max_field_bytes, and the largest ones are truncated
+    further until the log fits in max_record_bytes (0 is unlimited). The prefix is never truncated. The logs
+    having some field truncated get a log_truncated field. Returns the serialized log and whether it was truncated.
+    """
+    field_limit = min(limit for limit in (max_field_bytes, max_record_bytes) if limit)
+
+    truncated = False
+    items = []
+    for key, value in log.items():
+        encoded, value_truncated = serialize_value_limited(value, field_limit)
+        truncated = truncated or value_truncated
+        items.append([serialize_key(key), encoded])
+
+    if max_record_bytes:
+        size = 2 + len(prefix or "") + sum(len(key) + 2 + len(value) for key, value in items) + 2 * len(items)
+        excess = size + len(TRUNCATION_FIELD) + 2 - max_record_bytes
+        if truncated or size > max_record_bytes:
+            for item in sorted(items, key=lambda item: len(item[1]), reverse=True):
+                if excess <= 0:
+                    break
+                value = item[1]
+                target = max(len(value) - excess, len(TRUNCATION_MARKER) + 2)
+                if not value.startswith('"') or target >= len(value):
+                    continue
+                item[1] = _truncate_encoded(value, target)
+                excess -= len(value) - len(item[1])
+                truncated = True
+
+    fields = ", ".join([f"{key}: {value}" for key, value in items] + ([TRUNCATION_FIELD] if truncated else []))
+    if prefix:
+        fields = f"{prefix}, {fields}" if fields else prefix
+
+    return "{" + fields + "}", truncated
+
+
+class MonotonicClock:
+    """
+    Provides the current time in milliseconds reading the monotonic clock, which is cheaper than reading
+    the wall clock, relative to a wall clock time captured when the clock is anchored
+    """
+
+    def __init__(self):
+        self._anchor_ms = None
+        self._anchor_ns = None
+        self.anchor()
+
+    def anchor(self):
+        self._anchor_ms = time.time_ns() // 1000000
+        self._anchor_ns = time.monotonic_ns()
+
+    def now_ms(self):
+        return self._anchor_ms + (time.monotonic_ns() - self._anchor_ns) // 1000000
+
+
+class TokenBucket:
+    """
+    Allows up to capacity operations, then refill_rate operations per second. It can be used by multiple threads.
+    """
+
+    def __init__(self, capacity, refill_rate=0):
+        self._capacity = capacity
+        self._refill_rate = refill_rate
+        self._tokens = capacity
+        self._last_refill_ns = time.monotonic_ns()
+        self._lock = threading.Lock()
+
+    def consume(self):
+        with self._lock:
+            if self._refill_rate:
+                now_ns = time.monotonic_ns()
+                self._tokens = min(self._capacity, self._tokens + (now_ns - self._last_refill_ns) * self._refill_rate / 1e9)
+                self._last_refill_ns = now_ns
+
+            if self._tokens < 1:
+                return False
+
+            self._tokens -= 1
+            return True
+
+
+class StackFormatter:
+    """
+    Formats the stack of an exception from its __traceback__, keeping only the innermost max_frames frames
+    (0 is unlimited), preceded by the chained exceptions (__cause__ and __context__) like the interpreter does.
+    The formatted frames are cached by code location, so repeated failures are formatted once. It can be used
+    by multiple threads.
+    """
+
+    CAUSE_SEPARATOR = "\n\nThe above exception was the direct cause of the following exception:\n\n"
+    CONTEXT_SEPARATOR = "\n\nDuring handling of the above exception, another exception occurred:\n\n"
+
+    def __init__(self, max_frames, max_cached=256):
+        self.max_frames = max_frames
+        self._max_cached = max_cached
+        # Formatted frames and fingerprint, by exception type, code location of the frames and link to the
+        # previous exception of the chain
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _get_chain(error):
+        """
+        Returns the chained exceptions, from the outermost, with the separator from the exception they caused
+        """
+        chain = []
+        seen = set()
+        separator = None
+        while error is not None and id(error) not in seen:
+            seen.add(id(error))
+            chain.append((error, separator))
+            if error.__cause__ is not None:
+                error, separator = error.__cause__, StackFormatter.CAUSE_SEPARATOR
+            elif error.__context__ is not None and not error.__suppress_context__:
+                error, separator = error.__context__, StackFormatter.CONTEXT_SEPARATOR
+            else:
+                error = None
+        return chain
+
+    def _get_location(self, error):
+        frames = []
+        tb = error.__traceback__
+        while tb is not None:
+            frames.append((tb.tb_frame.f_code, tb.tb_lineno))
+            tb = tb.tb_next
+        if self.max_frames and len(frames) > self.max_frames:
+            return len(frames) - self.max_frames, tuple(frames[-self.max_frames:])
+        return 0, tuple(frames)
+
+    def _format_frames(self, error, omitted, frames):
+        import traceback
+
+        walked = list(traceback.walk_tb(error.__traceback__))[-len(frames):] if frames else []
+        summary = traceback.StackSummary.extract(walked)
+
+        lines = ["Traceback (most recent call last):"] if frames else []
+        if omitted:
+            lines.append(f"  ... {omitted} frames omitted")
+        for frame in summary:
+            lines.append(f'  File "{frame.filename}", line {frame.lineno}, in {frame.name}')
+            if frame.line:
+                lines.append(f"    {frame.line}")
+
+        error_type = type(error)
+        location = [error_type.__module__, error_type.__qualname__] + [f"{code.co_filename}:{lineno}" for code, lineno in frames]
+        return "\n".join(lines), " ".join(location)
+
+    @staticmethod
+    def _format_error(error):
+        error_str = f"{type(error).__qualname__}: {error}" if str(error) else type(error).__qualname__
+        if type(error).__module__ not in ("builtins", "__main__"):
+            error_str = f"{type(error).__module__}.{error_str}"
+        return error_str
+
+    def format(self, error):
+        """
+        Returns the formatted stack of the error and its fingerprint, the same for all the errors of the same
+        type raised at the same code location, with the same chained exceptions
+        """
+        chain = self._get_chain(error)
+        locations = [(chained, separator, *self._get_location(chained)) for chained, separator in chain]
+        key = tuple((type(chained), separator, omitted, frames) for chained, separator, omitted, frames in locations)
 
-    for key, value in response.items():
-        if value is None:
-            response[key] = None
-        elif isinstance(value, (str, bool)):
-            response[key] = value
-        elif isinstance(value, (list, dict)):
-            response[key] = json.dumps(value)
-        elif math.isnan(value) or (isinstance(value, (int, float)) and not math.isfinite(value)):
-            response[key] = None
-        else:
-            response[key] = value
+        cached = self._cache.get(key)
+        if cached is None:
+            formatted = [self._format_frames(chained, omitted, frames) for chained, _, omitted, frames in locations]
+            fingerprint = f"{zlib.crc32(' | '.join(location for _, location in formatted).encode('utf-8')):08x}"
+            cached = [frames_str for frames_str, _ in formatted], fingerprint
+            with self._lock:
+                if key not in self._cache and len(self._cache) >= self._max_cached:
+                    del self._cache[next(iter(self._cache))]
+                self._cache[key] = cached
 
-    return json.dumps(response)
+        frames_strs, fingerprint = cached
+        stack = ""
+        # Printed from the innermost exception of the chain, like the interpreter does
+        for (chained, separator), frames_str in reversed(list(zip(chain, frames_strs))):
+            error_str = self._format_error(chained)
+            stack += f"{frames_str}\n{error_str}" if frames_str else error_str
+            if separator is not None:
+                stack += separator
+        return stack, fingerprint
@@ -0,0 +1,114 @@
+import json
+import time
+import asyncio
+import builtins
+import threading
+from lambda_powertools.batch import batch_handler, _record_metrics
+
+CONTEXT = type('', (object,), {"aws_request_id": "awsRequestId"})()
+
+
+def sqs_event(*message_ids):
+    return {"Records": [{"eventSource": "aws:sqs", "messageId": message_id, "body": message_id} for message_id in message_ids]}
+
+
+def test_batch_handler_reports_the_failed_records(mocker):
+    print_spy = mocker.spy(builtins, "print")
+
+    def process_record(record, context):
+        if record["body"] == "2":
+            raise ValueError("boom")
+
+    response = batch_handler(process_record)(sqs_event("1", "2", "3"), CONTEXT)
+
+    assert response == {"batchItemFailures": [{"itemIdentifier": "2"}]}
+    log = json.loads(print_spy.call_args.args[0])
+    assert log["message_id"] == "2"
+    assert log["aws_request_id"] == "awsRequestId"
+    assert log["error_message"] == "boom"
+    assert _record_metrics["success"][0]._value.get() == 2
+    assert _record_metrics["failure"][0]._value.get() == 1
+
+
+def test_batch_handler_processes_the_records_concurrently():
+    running = []
+    max_running = []
+    lock = threading.Lock()
+
+    def process_record(record, context):
+        with lock:
+            running.append(record)
+            max_running.append(len(running))
+        time.sleep(0.01)
+        with lock:
+            running.remove(record)
+
+    response = batch_handler(process_record, max_concurrency=2)(sqs_event("1", "2", "3", "4"), CONTEXT)
+
+    assert response == {"batchItemFailures": []}
+    assert max(max_running) == 2
+
+
+def test_batch_handler_processes_async_records_up_to_the_max_concurrency():
+    running = []
+    max_running = []
+
+    async def process_record(record, context):
+        running.append(record)
+        max_running.append(len(running))
+        await asyncio.sleep(0.01)
+        running.remove(record)
+        if record["body"] == "3":
+            raise ValueError("boom")
+
+    response = batch_handler(process_record, max_concurrency=2)(sqs_event("1", "2", "3", "4"), CONTEXT)
+
+    assert response == {"batchItemFailures": [{"itemIdentifier": "3"}]}
+    assert max(max_running) == 2
+
+
+def test_batch_handler_reports_kinesis_sequence_numbers():
+    def process_record(record, context):
+        raise ValueError("boom")
+
+    event = {"Records": [{"eventSource": "aws:kinesis", "kinesis": {"sequenceNumber": "49590338271490256608559692538361571095921575989136588898", "partitionKey": "key"}}]}
+    response = batch_handler(process_record)(event, CONTEXT)
+
+    assert response == {"batchItemFailures": [{"itemIdentifier": "49590338271490256608559692538361571095921575989136588898"}]}
+
+
+def test_batch_handler_processes_the_records_of_the_same_ordering_key_in_order():
+    processed = []
+
+    def process_record(record, context):
+        time.sleep(0.01 if record["body"] == "a1" else 0)
+        processed.append(record["body"])
+        if record["body"] == "b1":
+            raise ValueError("boom")
+
+    event = {"Records": [
+        {"eventSource": "aws:sqs", "messageId": body, "body": body, "attributes": {"MessageGroupId": body[0]}}
+        for body in ("a1", "b1", "a2", "b2", "a3")
+    ]}
+    response = batch_handler(process_record, max_concurrency=4)(event, CONTEXT)
+
+    assert response == {"batchItemFailures": [{"itemIdentifier": "b1"}, {"itemIdentifier": "b2"}]}
+    assert [body for body in processed if body[0] == "a"] == ["a1", "a2", "a3"]
+    assert "b2" not in processed
+
+
+def test_batch_handler_processes_async_records_of_the_same_partition_key_in_order():
+    processed = []
+
+    async def process_record(record, context):
+        await asyncio.sleep(0.01 if record["kinesis"]["sequenceNumber"] == "1" else 0)
+        processed.append(record["kinesis"]["sequenceNumber"])
+
+    event = {"Records": [
+        {"eventSource": "aws:kinesis", "kinesis": {"sequenceNumber": str(number), "partitionKey": str(number % 2)}}
+        for number in range(1, 6)
+    ]}
+    response = batch_handler(process_record, max_concurrency=4)(event, CONTEXT)
+
+    assert response == {"batchItemFailures": []}
+    assert [number for number in processed if int(number) % 2] == ["1", "3", "5"]
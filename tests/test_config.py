@@ -0,0 +1,68 @@
+import pytest
+from lambda_powertools.config import Config
+
+
+@pytest.fixture(autouse=True)
+def reload_config():
+    yield
+    Config.reload()
+
+
+def test_config_uses_the_defaults_when_the_environment_is_empty():
+    Config.reload({})
+
+    assert Config.LOG_LEVEL == "INFO"
+    assert Config.LOG_THROTTLE_ENABLED is False
+    assert Config.LOG_THROTTLE == {"INFO": 0.1, "WARN": 0.2}
+    assert Config.LOG_BUFFER_ENABLED is False
+
+
+def test_config_parses_the_environment():
+    Config.reload({
+        "LOG_LEVEL": "WARN",
+        "LOG_THROTTLE_ENABLED": "1",
+        "LOG_THROTTLE_INFO": "0.5",
+        "LOG_THROTTLE_DEBUG": "0",
+        "LOG_BUFFER_ENABLED": "true",
+        "LOG_BUFFER_MAX_RECORDS": "10",
+    })
+
+    assert Config.LOG_LEVEL == "WARN"
+    assert Config.LOG_THROTTLE_ENABLED is True
+    assert Config.LOG_THROTTLE == {"DEBUG": 0.0, "INFO": 0.5, "WARN": 0.2}
+    assert Config.LOG_BUFFER_ENABLED is True
+    assert Config.LOG_BUFFER_MAX_RECORDS == 10
+
+
+def test_config_ignores_invalid_numbers():
+    Config.reload({"LOG_THROTTLE_INFO": "foo", "LOG_BUFFER_MAX_RECORDS": "bar"})
+
+    assert Config.LOG_THROTTLE["INFO"] == 0.1
+    assert Config.LOG_BUFFER_MAX_RECORDS == 1000
+
+
+def test_config_override_changes_the_settings():
+    Config.override(LOG_THROTTLE_ENABLED=True)
+
+    assert Config.is_log_throttle_enabled() is True
+
+
+def test_config_override_rejects_unknown_settings():
+    with pytest.raises(AttributeError):
+        Config.override(FOO=True)
+
+
+def test_config_parses_the_named_logger_levels():
+    Config.reload({"LOG_LEVELS": "db=debug, http.client=WARN,cache=FOO,=INFO"})
+
+    assert Config.LOG_LEVELS == {"db": "DEBUG", "http.client": "WARN"}
+
+
+def test_config_version_changes_with_the_settings():
+    version = Config.VERSION
+    Config.override(LOG_LEVEL="DEBUG")
+    assert Config.VERSION > version
+
+    version = Config.VERSION
+    Config.reload()
+    assert Config.VERSION > version
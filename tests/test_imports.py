@@ -0,0 +1,56 @@
+import sys
+import subprocess
+
+# Max cumulative import time of the modules, in us. Generous compared to the actual time, to catch only
+# the heavy imports added by mistake on slow machines.
+IMPORT_BUDGET_US = {
+    "lambda_powertools.logger": 50000,
+    "lambda_powertools.runtime": 60000,
+}
+
+DEFERRED_MODULES = ("prometheus_client", "lambda_powertools.prometheus", "asyncio", "traceback", "random", "datetime")
+
+
+def import_module(module):
+    """
+    Imports the module in a new interpreter, returning its cumulative import time in us and the modules imported
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import sys, {module}; print(','.join(sys.modules))"],
+        capture_output=True, text=True, check=True
+    )
+    import_time = None
+    for line in result.stderr.splitlines():
+        parts = [part.strip() for part in line.split("|")]
+        if len(parts) == 3 and parts[2] == module:
+            import_time = int(parts[1])
+    return import_time, set(result.stdout.strip().split(","))
+
+
+def test_logger_import_time_is_within_budget():
+    import_time, modules = import_module("lambda_powertools.logger")
+
+    assert import_time < IMPORT_BUDGET_US["lambda_powertools.logger"]
+    assert modules.isdisjoint(DEFERRED_MODULES)
+
+
+def test_runtime_does_not_import_prometheus_until_used():
+    import_time, modules = import_module("lambda_powertools.runtime")
+
+    assert import_time < IMPORT_BUDGET_US["lambda_powertools.runtime"]
+    assert modules.isdisjoint(DEFERRED_MODULES)
+
+
+def test_power_handler_of_a_function_only_logging_does_not_import_prometheus():
+    code = (
+        "import sys\n"
+        "from lambda_powertools.runtime import power_handler\n"
+        "from lambda_powertools.logger import logger\n"
+        "context = type('', (object,), {'aws_request_id': 'awsRequestId'})()\n"
+        "power_handler(lambda event, context: logger.info('this is a log'))({}, context)\n"
+        "print('prometheus_client' in sys.modules, file=sys.stderr)\n"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+
+    assert '"message": "this is a log"' in result.stdout
+    assert result.stderr.strip() == "False"
@@ -1,13 +1,16 @@
 import pytest
 import os
+import asyncio
+import threading
 import builtins
-import datetime
+import time
 import json
 from unittest import mock
 from lambda_powertools.logger import logger
+from lambda_powertools.utils import MonotonicClock
 from lambda_powertools.config import Config
 
-MOCK_DATE_MS = 1679313252.708
+MOCK_TIME_NS = 1679313252708 * 1000000
 
 
 @pytest.fixture(autouse=True)
@@ -16,20 +19,17 @@ def mock_before_each():
             os.environ,
             {"LOG_THROTTLE_ENABLED": "false"}
     ):
+        Config.reload()
         yield
+    Config.reload()
 
 
 @pytest.fixture(autouse=True)
-def patch_datetime_now(monkeypatch):
-    class MyDateTime:
-        @classmethod
-        def now(cls):
-            return MyDateTime()
-
-        def timestamp(self):
-            return MOCK_DATE_MS
-
-    monkeypatch.setattr(datetime, 'datetime', MyDateTime)
+def patch_time_ns(monkeypatch):
+    monkeypatch.setattr(time, 'time_ns', lambda: MOCK_TIME_NS)
+    # The logger clock advances from the wall clock time read on reset, so the time of a log could move past
+    # the mocked millisecond: keep it still
+    monkeypatch.setattr(MonotonicClock, 'now_ms', lambda self: self._anchor_ms)
 
 
 @pytest.fixture(scope='function')
@@ -170,7 +170,7 @@ def test_provided_error_is_printed_with_the_log(info_logger, mocker):
     print_spy.assert_called_with("{}\n".format(json.dumps({
         # From error
         "error_message": "bar",
-        "error_stack": "NoneType: None",
+        "error_stack": "Exception: bar",
         # Other
         "time": 1679313252708,
         "loglevel": "INFO",
@@ -193,7 +193,7 @@ def test_provided_context_and_error_are_printed_with_the_log(info_logger, mocker
         "foo": '{"bar": {"baz": "foobarbaz"}}',
         # From error
         "error_message": "bar",
-        "error_stack": "NoneType: None",
+        "error_stack": "Exception: bar",
         # Other
         "time": 1679313252708,
         "loglevel": "INFO",
@@ -201,10 +201,9 @@ def test_provided_context_and_error_are_printed_with_the_log(info_logger, mocker
     })))
 
 
-@mock.patch.dict(os.environ, {"LOG_THROTTLE_ENABLED": "true"})
 def test_not_all_messages_should_be_logged_with_throttling_enabled(info_logger, mocker):
     print_spy = mocker.spy(builtins, "print")
-    Config.LOG_THROTTLE = {"INFO": 0.1}
+    Config.override(LOG_THROTTLE_ENABLED=True, LOG_THROTTLE={"INFO": 0.1})
 
     info_logger.info("1")
     info_logger.info("2")
@@ -220,10 +219,9 @@ def test_not_all_messages_should_be_logged_with_throttling_enabled(info_logger,
     assert print_spy.call_count < 10
 
 
-@mock.patch.dict(os.environ, {"LOG_THROTTLE_ENABLED": "false"})
 def test_all_messages_should_be_logged_with_throttling_disabled(info_logger, mocker):
     print_spy = mocker.spy(builtins, "print")
-    Config.LOG_THROTTLE = {"INFO": 0.1}
+    Config.override(LOG_THROTTLE_ENABLED=False, LOG_THROTTLE={"INFO": 0.1})
 
     info_logger.info("1")
     info_logger.info("2")
@@ -237,3 +235,485 @@ def test_all_messages_should_be_logged_with_throttling_disabled(info_logger, moc
     info_logger.info("10")
 
     assert print_spy.call_count == 10
+
+
+def test_buffered_messages_are_written_at_once_on_flush(mocker):
+    Config.override(LOG_BUFFER_ENABLED=True)
+    logger.reset()
+    print_spy = mocker.spy(builtins, "print")
+
+    logger.info("1")
+    logger.info("2")
+    print_spy.assert_not_called()
+
+    logger.flush()
+    print_spy.assert_called_once_with(
+        '{"time": 1679313252708, "loglevel": "INFO", "message": "1"}\n\n'
+        '{"time": 1679313252708, "loglevel": "INFO", "message": "2"}\n\n',
+        end=""
+    )
+
+
+def test_buffered_messages_are_written_when_the_threshold_is_reached(mocker):
+    Config.override(LOG_BUFFER_ENABLED=True, LOG_BUFFER_MAX_RECORDS=2)
+    logger.reset()
+    print_spy = mocker.spy(builtins, "print")
+
+    logger.info("1")
+    print_spy.assert_not_called()
+    logger.info("2")
+    print_spy.assert_called_once()
+
+
+def test_buffered_messages_of_concurrent_threads_are_written_once(mocker):
+    Config.override(LOG_BUFFER_ENABLED=True, LOG_BUFFER_MAX_RECORDS=7, LOG_RATE_LIMIT={"INFO": 200}, LOG_RATE_LIMIT_REFILL={})
+    logger.reset()
+    logger.set_level("INFO")
+    print_spy = mocker.spy(builtins, "print")
+
+    def log_messages(thread):
+        for index in range(100):
+            logger.info(f"{thread}-{index}")
+
+    threads = [threading.Thread(target=log_messages, args=(thread,)) for thread in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    logger.close()
+
+    records = [json.loads(record) for call in print_spy.call_args_list for record in call.args[0].split("\n\n") if record]
+    messages = [record["message"] for record in records if record["message"] != "Logs suppressed"]
+    assert len(messages) == 200
+    assert len(set(messages)) == 200
+    assert records[-1]["message"] == "Logs suppressed"
+    assert records[-1]["rate_limited_info"] == 600
+
+
+def test_buffered_messages_are_written_immediately_on_error(mocker):
+    Config.override(LOG_BUFFER_ENABLED=True)
+    logger.reset()
+    print_spy = mocker.spy(builtins, "print")
+
+    logger.info("1")
+    logger.error("2")
+    print_spy.assert_called_once_with(
+        '{"time": 1679313252708, "loglevel": "INFO", "message": "1"}\n\n'
+        '{"time": 1679313252708, "loglevel": "ERROR", "message": "2"}\n\n',
+        end=""
+    )
+
+
+def test_provided_context_overrides_the_captured_one(info_logger, mocker):
+    print_spy = mocker.spy(builtins, "print")
+
+    info_logger.capture(
+        env={"AWS_LAMBDA_FUNCTION_NAME": "lambda-powertools"},
+        context=type('', (object,), {"aws_request_id": "awsRequestId"})()
+    )
+    info_logger.info("boo", {"foo": "bar", "aws_request_id": "overridden"})
+
+    print_spy.assert_called_once_with("{}\n".format(json.dumps({
+        "function_name": "lambda-powertools",
+        "function_memory": 0,
+        "aws_request_id": "overridden",
+        "foo": "bar",
+        "time": 1679313252708,
+        "loglevel": "INFO",
+        "message": "boo"
+    })))
+
+
+def test_is_enabled_should_respect_log_level(info_logger):
+    assert info_logger.is_enabled("DEBUG") is False
+    assert info_logger.is_enabled("INFO") is True
+    assert info_logger.is_enabled("ERROR") is True
+
+
+def test_lazy_message_and_context_are_not_evaluated_for_suppressed_logs(info_logger, mocker):
+    print_spy = mocker.spy(builtins, "print")
+    message = mocker.Mock(return_value="boo")
+    context = mocker.Mock(return_value={"foo": "bar"})
+
+    info_logger.debug(message, context)
+
+    message.assert_not_called()
+    context.assert_not_called()
+    print_spy.assert_not_called()
+
+
+def test_lazy_message_and_context_are_evaluated_for_written_logs(info_logger, mocker):
+    print_spy = mocker.spy(builtins, "print")
+
+    info_logger.info(lambda: "boo", lambda: {"foo": "bar"})
+
+    print_spy.assert_called_once_with('{"foo": "bar", "time": 1679313252708, "loglevel": "INFO", "message": "boo"}\n')
+
+
+def test_message_is_formatted_with_the_provided_args(info_logger, mocker):
+    print_spy = mocker.spy(builtins, "print")
+
+    info_logger.info("boo %s %d", args=("foo", 1))
+
+    print_spy.assert_called_once_with('{"time": 1679313252708, "loglevel": "INFO", "message": "boo foo 1"}\n')
+
+
+def test_request_throttling_keeps_or_drops_all_the_logs_of_a_request(info_logger, mocker):
+    Config.override(LOG_THROTTLE_ENABLED=True, LOG_THROTTLE_MODE="request", LOG_THROTTLE={"INFO": 0.5})
+
+    for request_id in ("request-1", "request-2", "request-3", "request-4"):
+        print_spy = mocker.spy(builtins, "print")
+        info_logger.capture(context=type('', (object,), {"aws_request_id": request_id})())
+        for _ in range(10):
+            info_logger.info("boo")
+
+        assert print_spy.call_count in (0, 10)
+        mocker.stop(print_spy)
+
+
+def test_rate_limit_caps_the_logs_of_an_execution(mocker):
+    Config.override(LOG_RATE_LIMIT={"INFO": 2}, LOG_RATE_LIMIT_REFILL={})
+    logger.reset()
+    print_spy = mocker.spy(builtins, "print")
+
+    for _ in range(5):
+        logger.info("boo")
+    logger.warn("boo")
+
+    assert print_spy.call_count == 3
+
+
+def test_close_logs_the_summary_of_the_suppressed_logs(mocker):
+    Config.override(LOG_RATE_LIMIT={"INFO": 1}, LOG_RATE_LIMIT_REFILL={})
+    logger.reset()
+    logger.info("boo")
+    logger.info("boo")
+    logger.info("boo")
+    print_spy = mocker.spy(builtins, "print")
+
+    logger.close()
+    logger.close()
+
+    print_spy.assert_called_once_with('{"rate_limited_info": 2, "time": 1679313252708, "loglevel": "INFO", "message": "Logs suppressed"}\n')
+
+
+def test_report_is_written_regardless_of_the_level(error_logger, mocker):
+    print_spy = mocker.spy(builtins, "print")
+
+    error_logger.report("Memory profile", {"rss_bytes": 1024})
+
+    print_spy.assert_called_once_with('{"rss_bytes": 1024, "time": 1679313252708, "loglevel": "INFO", "message": "Memory profile"}\n')
+
+
+def test_close_does_not_summarize_the_throttled_logs(info_logger, mocker):
+    Config.override(LOG_THROTTLE_ENABLED=True, LOG_THROTTLE={"INFO": 0})
+    info_logger.info("boo")
+    print_spy = mocker.spy(builtins, "print")
+
+    info_logger.close()
+
+    print_spy.assert_not_called()
+
+
+def test_bound_logger_adds_the_bound_fields(info_logger, mocker):
+    print_spy = mocker.spy(builtins, "print")
+    info_logger.capture(context=type('', (object,), {"aws_request_id": "awsRequestId"})())
+
+    bound_logger = info_logger.bind(foo="bar").bind(baz=1)
+    bound_logger.debug("boo")
+    bound_logger.info("boo", {"qux": True})
+
+    print_spy.assert_called_once_with("{}\n".format(json.dumps({
+        "aws_request_id": "awsRequestId",
+        "foo": "bar",
+        "baz": 1,
+        "qux": True,
+        "time": 1679313252708,
+        "loglevel": "INFO",
+        "message": "boo"
+    })))
+
+
+def test_bound_logger_uses_the_context_of_the_current_execution(info_logger, mocker):
+    bound_logger = info_logger.bind(foo="bar")
+    info_logger.capture(context=type('', (object,), {"aws_request_id": "first"})())
+    bound_logger.info("boo")
+
+    print_spy = mocker.spy(builtins, "print")
+    info_logger.capture(context=type('', (object,), {"aws_request_id": "second"})())
+    bound_logger.info("boo", {"aws_request_id": "overridden"})
+
+    print_spy.assert_called_once_with("{}\n".format(json.dumps({
+        "aws_request_id": "overridden",
+        "foo": "bar",
+        "time": 1679313252708,
+        "loglevel": "INFO",
+        "message": "boo"
+    })))
+
+
+def test_added_context_is_local_to_the_asyncio_task(info_logger, mocker):
+    print_spy = mocker.spy(builtins, "print")
+    info_logger.capture(context=type('', (object,), {"aws_request_id": "awsRequestId"})())
+
+    async def process(message_id):
+        info_logger.add_context(message_id=message_id)
+        await asyncio.sleep(0)
+        info_logger.info("boo")
+
+    async def main():
+        await asyncio.gather(process("1"), process("2"))
+        info_logger.info("boo")
+
+    asyncio.run(main())
+
+    logs = sorted(json.loads(call.args[0]).get("message_id", "") for call in print_spy.call_args_list)
+    assert logs == ["", "1", "2"]
+    assert all(json.loads(call.args[0])["aws_request_id"] == "awsRequestId" for call in print_spy.call_args_list)
+
+
+def test_logs_of_other_threads_have_the_captured_context(info_logger, mocker):
+    print_spy = mocker.spy(builtins, "print")
+    info_logger.capture(context=type('', (object,), {"aws_request_id": "awsRequestId"})())
+
+    thread = threading.Thread(target=lambda: info_logger.info("boo"))
+    thread.start()
+    thread.join()
+
+    assert json.loads(print_spy.call_args.args[0])["aws_request_id"] == "awsRequestId"
+
+
+def test_reset_removes_the_added_context(info_logger, mocker):
+    info_logger.add_context(foo="bar")
+    info_logger.reset()
+    print_spy = mocker.spy(builtins, "print")
+
+    info_logger.info("boo")
+
+    print_spy.assert_called_once_with('{"time": 1679313252708, "loglevel": "INFO", "message": "boo"}\n')
+
+
+def raise_nested(depth, message="boom"):
+    if depth == 0:
+        raise ValueError(message)
+    raise_nested(depth - 1, message)
+
+
+def test_error_stack_is_captured_from_the_provided_error(info_logger, mocker):
+    print_spy = mocker.spy(builtins, "print")
+
+    try:
+        raise_nested(0)
+    except ValueError as e:
+        error = e
+
+    # Not the error being currently handled
+    info_logger.info("boo", error=error)
+
+    log = json.loads(print_spy.call_args.args[0])
+    assert log["error_message"] == "boom"
+    lines = log["error_stack"].split("\n")
+    assert lines[0] == "Traceback (most recent call last):"
+    assert lines[-3].endswith("in raise_nested")
+    assert lines[-1] == "ValueError: boom"
+
+
+def test_error_stack_is_limited_to_the_innermost_frames(info_logger, mocker):
+    print_spy = mocker.spy(builtins, "print")
+    Config.override(LOG_ERROR_MAX_FRAMES=3)
+    info_logger.reset()
+
+    try:
+        raise_nested(10)
+    except ValueError as e:
+        info_logger.info("boo", error=e)
+
+    lines = json.loads(print_spy.call_args.args[0])["error_stack"].split("\n")
+    assert lines[1] == "  ... 9 frames omitted"
+    assert sum(1 for line in lines if line.startswith("  File")) == 3
+
+
+def test_error_stack_is_formatted_once_per_code_location(info_logger, mocker):
+    print_spy = mocker.spy(builtins, "print")
+    format_spy = mocker.spy(info_logger._stack_formatter, "_format_frames")
+
+    for message in ("first", "second"):
+        try:
+            raise_nested(2, message)
+        except ValueError as e:
+            info_logger.info("boo", error=e)
+
+    format_spy.assert_called_once()
+    assert json.loads(print_spy.call_args.args[0])["error_stack"].endswith("ValueError: second")
+
+
+def test_error_stack_includes_the_chained_errors(info_logger, mocker):
+    print_spy = mocker.spy(builtins, "print")
+    Config.override(LOG_ERROR_STACK_MODE="fingerprint")
+    info_logger.reset()
+
+    def raise_chained(cause, suppress):
+        try:
+            raise_nested(1)
+        except ValueError as e:
+            if cause:
+                raise KeyError("wrapped") from e
+            if suppress:
+                raise KeyError("wrapped") from None
+            raise KeyError("wrapped")
+
+    for cause, suppress in ((True, False), (False, False), (False, True)):
+        try:
+            raise_chained(cause, suppress)
+        except KeyError as e:
+            info_logger.info("boo", error=e)
+
+    caused, handled, suppressed = [json.loads(call.args[0]) for call in print_spy.call_args_list]
+    assert caused["error_stack"].startswith("Traceback (most recent call last):")
+    assert "ValueError: boom\n\nThe above exception was the direct cause of the following exception:\n\nTraceback" in caused["error_stack"]
+    assert caused["error_stack"].endswith("KeyError: 'wrapped'")
+    assert "ValueError: boom\n\nDuring handling of the above exception, another exception occurred:\n\n" in handled["error_stack"]
+    assert "ValueError" not in suppressed["error_stack"]
+    assert len({caused["error_fingerprint"], handled["error_fingerprint"], suppressed["error_fingerprint"]}) == 3
+
+
+def test_error_stack_is_logged_once_per_execution_in_fingerprint_mode(info_logger, mocker):
+    print_spy = mocker.spy(builtins, "print")
+    Config.override(LOG_ERROR_STACK_MODE="fingerprint")
+
+    for _ in range(2):
+        try:
+            raise_nested(2)
+        except ValueError as e:
+            info_logger.info("boo", error=e)
+
+    first, second = [json.loads(call.args[0]) for call in print_spy.call_args_list]
+    assert "error_stack" in first
+    assert "error_stack" not in second
+    assert first["error_fingerprint"] == second["error_fingerprint"]
+
+
+def test_oversized_logs_are_truncated_and_counted(info_logger, mocker, monkeypatch):
+    print_spy = mocker.spy(builtins, "print")
+    Config.override(LOG_MAX_FIELD_BYTES=50)
+    monkeypatch.setattr(info_logger, "truncated", 0)
+
+    info_logger.info("boo", {"payload": "a" * 1000})
+
+    log = json.loads(print_spy.call_args.args[0])
+    assert log["payload"] == "a" * 34 + "...[truncated]"
+    assert log["log_truncated"] is True
+    assert info_logger.truncated == 1
+
+
+def test_oversized_logs_of_concurrent_threads_are_all_counted(info_logger, mocker, monkeypatch):
+    mocker.patch("builtins.print")
+    Config.override(LOG_MAX_FIELD_BYTES=50)
+    monkeypatch.setattr(info_logger, "truncated", 0)
+
+    def log_oversized():
+        for _ in range(200):
+            info_logger.info("boo", {"payload": "a" * 100})
+
+    threads = [threading.Thread(target=log_oversized) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert info_logger.truncated == 1600
+
+
+def test_repeated_logs_are_aggregated_when_flushed(mocker):
+    Config.override(LOG_AGGREGATION_ENABLED=True, LOG_AGGREGATION_SAMPLE_SIZE=2)
+    logger.reset()
+    print_spy = mocker.spy(builtins, "print")
+
+    context = {"attempt": 0}
+    for attempt in range(5):
+        context["attempt"] = attempt
+        logger.warn("Retrying", context)
+    logger.info("Done")
+    logger.error("Failed")
+
+    # The first occurrences are written immediately
+    retrying, done, failed = [json.loads(call.args[0]) for call in print_spy.call_args_list]
+    assert retrying == {"attempt": 0, "time": 1679313252708, "loglevel": "WARN", "message": "Retrying"}
+    assert done == {"time": 1679313252708, "loglevel": "INFO", "message": "Done"}
+    assert failed["message"] == "Failed"
+
+    logger.flush()
+
+    assert print_spy.call_count == 4
+    assert json.loads(print_spy.call_args.args[0]) == {
+        "aggregated_count": 5,
+        "aggregated_first_time": 1679313252708,
+        "aggregated_last_time": 1679313252708,
+        "aggregated_context_sample": '[{"attempt": 1}, {"attempt": 2}]',
+        "time": 1679313252708,
+        "loglevel": "WARN",
+        "message": "Retrying"
+    }
+
+
+def test_aggregated_repetitions_do_not_consume_the_rate_limit(mocker):
+    Config.override(LOG_AGGREGATION_ENABLED=True, LOG_RATE_LIMIT={"INFO": 2}, LOG_RATE_LIMIT_REFILL={})
+    logger.reset()
+    logger.set_level("INFO")
+    print_spy = mocker.spy(builtins, "print")
+
+    for _ in range(5):
+        logger.info("1")
+    logger.info("2")
+    logger.info("3")
+    logger.close()
+
+    logs = [json.loads(call.args[0]) for call in print_spy.call_args_list]
+    assert [(log["message"], log.get("aggregated_count"), log.get("rate_limited_info")) for log in logs] == [
+        ("1", None, None), ("2", None, None), ("Logs suppressed", None, 1), ("1", 5, None)
+    ]
+
+
+def test_logs_beyond_the_max_aggregation_keys_are_written(mocker):
+    Config.override(LOG_AGGREGATION_ENABLED=True, LOG_AGGREGATION_MAX_KEYS=1)
+    logger.reset()
+    print_spy = mocker.spy(builtins, "print")
+
+    for _ in range(2):
+        logger.info("1")
+        logger.info("2")
+    logger.flush()
+
+    messages = [json.loads(call.args[0]) for call in print_spy.call_args_list]
+    assert [(log["message"], log.get("aggregated_count")) for log in messages] == [("1", None), ("2", None), ("2", None), ("1", 2)]
+
+
+def test_named_loggers_use_the_configured_levels(mocker):
+    Config.override(LOG_LEVEL="INFO", LOG_LEVELS={"db": "DEBUG", "http": "WARN"})
+    logger.reset()
+    print_spy = mocker.spy(builtins, "print")
+
+    logger.get_logger("db.pool").debug("db debug")
+    logger.get_logger("http").info("http info")
+    logger.get_logger("cache").debug("cache debug")
+    logger.get_logger("cache").info("cache info")
+
+    messages = [json.loads(call.args[0]) for call in print_spy.call_args_list]
+    assert [(log["logger"], log["message"]) for log in messages] == [("db.pool", "db debug"), ("cache", "cache info")]
+
+
+def test_named_loggers_levels_follow_the_logger_and_the_config():
+    named = logger.get_logger("http")
+    Config.override(LOG_LEVEL="INFO", LOG_LEVELS={"http": "WARN"})
+    logger.reset()
+    assert named._level == logger.LEVELS["WARN"]
+
+    # The x-debug header doesn't change the level of the configured loggers
+    logger.capture(event={"headers": {"x-debug": "true"}})
+    assert named._level == logger.LEVELS["WARN"]
+    assert logger.get_logger("other")._level == logger.LEVELS["DEBUG"]
+
+    Config.override(LOG_LEVELS={})
+    logger.reset()
+    assert named._level == logger.LEVELS["INFO"]
+    assert named.bind(foo="bar").is_enabled("INFO")
@@ -0,0 +1,72 @@
+import os
+import threading
+import pytest
+from prometheus_client import Counter, Histogram, REGISTRY
+from lambda_powertools.pool import process_map
+from lambda_powertools.logger import logger
+from lambda_powertools import prometheus
+
+
+@pytest.fixture()
+def metrics():
+    counter = Counter(name="pool_spec_counter", documentation="Pool example counter", labelnames=["foo"])
+    histogram = Histogram(name="pool_spec_histogram", documentation="Pool example histogram", buckets=[1, 2, 5])
+    prometheus.reset()
+    yield counter, histogram
+    REGISTRY.unregister(counter)
+    REGISTRY.unregister(histogram)
+
+
+def test_process_map_returns_the_results_in_order(metrics):
+    assert process_map(lambda item: item * 2, range(5), processes=2) == [0, 2, 4, 6, 8]
+
+
+def test_process_map_merges_the_metrics_of_the_workers(metrics):
+    counter, histogram = metrics
+
+    def work(item):
+        counter.labels("bar").inc(item)
+        histogram.observe(item)
+        return os.getpid()
+
+    pids = process_map(work, [1, 2, 3], processes=3)
+
+    assert len(set(pids)) == 3 and os.getpid() not in pids
+    assert counter.labels("bar")._value.get() == 6
+    assert histogram._sum.get() == 6
+    assert "pool_spec_counter_total" in prometheus.get_metrics()
+
+
+def test_process_map_ships_the_logger_context_to_the_workers(metrics, capfd):
+    logger.reset()
+    logger.add_context(request="foo")
+
+    process_map(lambda item: logger.info("In worker"), [1], processes=1)
+
+    assert '"request": "foo"' in capfd.readouterr().out
+
+
+def test_process_map_raises_the_errors_of_the_workers(metrics):
+    def work(item):
+        if item == 2:
+            raise ValueError("boom")
+        return item
+
+    with pytest.raises(ValueError, match="boom"):
+        process_map(work, [1, 2, 3], processes=3)
+
+
+def test_process_map_refuses_to_fork_from_other_threads(metrics):
+    errors = []
+
+    def run():
+        try:
+            process_map(lambda item: item, [1])
+        except RuntimeError as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join()
+
+    assert len(errors) == 1
@@ -0,0 +1,41 @@
+import tracemalloc
+from lambda_powertools.profiling import MemoryProfile
+
+
+def allocate(count):
+    return [object() for _ in range(count)]
+
+
+def test_memory_profile_reports_only_the_allocations_of_the_execution_when_already_tracing():
+    tracemalloc.start()
+    try:
+        before = allocate(10000)
+        peak_before = tracemalloc.get_traced_memory()[1]
+        profile = MemoryProfile(tracemalloc_enabled=True, top=50)
+
+        profile.start()
+        during = allocate(100)
+        measures = profile.stop()
+
+        assert tracemalloc.is_tracing()
+        assert tracemalloc.get_traced_memory()[1] >= peak_before
+    finally:
+        tracemalloc.stop()
+
+    assert "traced_peak_bytes" not in measures
+    site = next(allocation for allocation in measures["top_allocations"] if allocation["count"] >= 100)
+    assert site["count"] < 1000
+    assert len(before) == 10000 and len(during) == 100
+
+
+def test_memory_profile_traces_the_execution():
+    profile = MemoryProfile(tracemalloc_enabled=True)
+
+    profile.start()
+    allocated = allocate(1000)
+    measures = profile.stop()
+
+    assert not tracemalloc.is_tracing()
+    assert measures["traced_peak_bytes"] > 0
+    assert measures["top_allocations"][0]["count"] >= 1000
+    assert len(allocated) == 1000
@@ -0,0 +1,117 @@
+import json
+import pytest
+from prometheus_client import Counter, Histogram, Summary
+from lambda_powertools.promdelta import Encoder, Decoder
+
+counter = Counter(
+    name="promdelta_spec_counter",
+    documentation="Promdelta example counter",
+    labelnames=["foo"],
+    registry=None
+)
+
+histogram = Histogram(
+    name="promdelta_spec_histogram",
+    documentation="Promdelta example histogram",
+    buckets=[1, 2, 5],
+    registry=None
+)
+
+
+@pytest.fixture(autouse=True)
+def before_each():
+    counter.clear()
+    histogram._sum.set(0)
+    for bucket in histogram._buckets:
+        bucket.set(0)
+
+
+def test_encoder_sends_metrics_and_label_values_only_once():
+    encoder = Encoder(container_id="container")
+    counter.labels("bar").inc(2)
+
+    first = json.loads(encoder.encode([(counter, [counter.labels("bar")])])[len("PROMDELTA "):])
+    second = json.loads(encoder.encode([(counter, [counter.labels("bar")])])[len("PROMDELTA "):])
+
+    assert first == {
+        "v": 1,
+        "c": "container",
+        "m": [[0, "promdelta_spec_counter", "counter", "Promdelta example counter", ["foo"], []]],
+        "l": [[0, "bar"]],
+        "s": [[0, 0, 2]]
+    }
+    assert second == {"v": 1, "c": "container", "s": [[0, 0, 2]]}
+
+
+def test_encoder_does_not_reuse_the_ids_of_forgotten_label_values():
+    encoder = Encoder(container_id="container")
+    decoder = Decoder()
+    for value in ("a", "b"):
+        counter.labels(value).inc(1)
+    decoder.decode(encoder.encode([(counter, [counter.labels("a"), counter.labels("b")])]))
+
+    encoder.forget_label_values(("a",))
+    counter.labels("c").inc(1)
+    decoder.decode(encoder.encode([(counter, [counter.labels("c")])]))
+
+    assert decoder.decode(encoder.encode([(counter, [counter.labels("b"), counter.labels("c")])])) == [
+        ("promdelta_spec_counter_total", {"foo": "b"}, 1.0),
+        ("promdelta_spec_counter_total", {"foo": "c"}, 1.0),
+    ]
+
+
+def test_encoder_sends_only_the_non_empty_buckets():
+    encoder = Encoder(container_id="container")
+    histogram.observe(1.5)
+    histogram.observe(4)
+
+    payload = json.loads(encoder.encode([(histogram, [histogram])])[len("PROMDELTA "):])
+
+    assert payload["s"] == [[0, 0, 5.5, 1, 1, 2, 1]]
+
+
+def test_encoder_returns_none_without_metrics():
+    assert Encoder().encode([]) is None
+
+
+def test_decoder_returns_the_prometheus_samples():
+    encoder = Encoder()
+    decoder = Decoder()
+    counter.labels("bar").inc(2)
+    histogram.observe(1.5)
+    histogram.observe(4)
+
+    samples = decoder.decode(encoder.encode([(counter, [counter.labels("bar")]), (histogram, [histogram])]))
+
+    assert samples == [
+        ("promdelta_spec_counter_total", {"foo": "bar"}, 2.0),
+        ("promdelta_spec_histogram_bucket", {"le": "1.0"}, 0.0),
+        ("promdelta_spec_histogram_bucket", {"le": "2.0"}, 1.0),
+        ("promdelta_spec_histogram_bucket", {"le": "5.0"}, 2.0),
+        ("promdelta_spec_histogram_bucket", {"le": "+Inf"}, 2.0),
+        ("promdelta_spec_histogram_count", {}, 2.0),
+        ("promdelta_spec_histogram_sum", {}, 5.5),
+    ]
+
+    # Second line of the same container, without metadata
+    samples = decoder.decode(encoder.encode([(counter, [counter.labels("bar")])]))
+    assert samples == [("promdelta_spec_counter_total", {"foo": "bar"}, 2.0)]
+
+
+def test_decoder_rejects_lines_of_unknown_metrics():
+    encoder = Encoder()
+    counter.labels("bar").inc(2)
+    encoder.encode([(counter, [counter.labels("bar")])])
+
+    with pytest.raises(ValueError):
+        Decoder().decode(encoder.encode([(counter, [counter.labels("bar")])]))
+
+
+def test_decoder_returns_the_summary_samples():
+    summary = Summary(name="promdelta_spec_summary", documentation="Promdelta example summary", registry=None)
+    summary.observe(2)
+    summary.observe(3)
+
+    samples = Decoder().decode(Encoder().encode([(summary, [summary])]))
+
+    assert samples == [("promdelta_spec_summary_count", {}, 2.0), ("promdelta_spec_summary_sum", {}, 5.0)]
@@ -1,9 +1,12 @@
 import os
+import json
 import pytest
 from unittest.mock import patch
 
-from lambda_powertools.prometheus import get_metrics, reset, flush_metrics
-from prometheus_client import Counter, Histogram, Gauge
+from lambda_powertools.prometheus import get_metrics, reset, flush_metrics, set_gauge_mode, register_exporter, EmfExporter, Exporter
+from lambda_powertools.promdelta import Decoder
+from lambda_powertools.config import Config
+from prometheus_client import Counter, Histogram, Gauge, Summary, REGISTRY, CollectorRegistry, generate_latest
 
 counter_no_labels = Counter(
     name="prometheus_spec_counter_no_labels",
@@ -39,6 +42,18 @@ gauge = Gauge(
     documentation="gauge_metric_documentation"
 )
 
+gauge_with_labels = Gauge(
+    name="prometheus_spec_gauge_with_labels",
+    documentation="Prometheus example gauge with labels",
+    labelnames=["foo"]
+)
+
+summary_with_labels = Summary(
+    name="prometheus_spec_summary_with_labels",
+    documentation="Prometheus example summary with labels",
+    labelnames=["foo"]
+)
+
 
 @pytest.fixture(autouse=True)
 def before_each(monkeypatch):
@@ -46,7 +61,7 @@ def before_each(monkeypatch):
 
 
 def test_prometheus_get_metrics_does_not_return_empty_metrics():
-    gauge.set(1)  # Gauge is not supported yet
+    gauge.set(1)
     counter_no_labels.inc(1)
     counter_with_labels.labels("bar").inc(2)
     histogram_no_labels.observe(2)
@@ -61,7 +76,7 @@ def test_prometheus_get_metrics_does_not_return_empty_metrics():
 
 
 def test_prometheus_get_metrics_returns_non_empty_metrics():
-    gauge.set(1)  # Gauge is not supported yet
+    gauge.set(1)
     counter_no_labels.inc(1)
     counter_with_labels.labels("bar").inc(2)
     histogram_no_labels.observe(2)
@@ -92,6 +107,9 @@ prometheus_spec_histogram_with_labels_bucket{foo="bar",le="5.0"} 1.0
 prometheus_spec_histogram_with_labels_bucket{foo="bar",le="+Inf"} 1.0
 prometheus_spec_histogram_with_labels_count{foo="bar"} 1.0
 prometheus_spec_histogram_with_labels_sum{foo="bar"} 2.0
+# HELP prometheus_spec_gauge_metric_name gauge_metric_documentation
+# TYPE prometheus_spec_gauge_metric_name gauge
+prometheus_spec_gauge_metric_name 1.0
 """
 
     assert metrics == expected
@@ -106,3 +124,289 @@ def test_prometheus_flush_metrics(mock_print):
     flush_metrics()
 
     mock_print.assert_called_with('PROMLOG ["# HELP prometheus_spec_counter_no_labels_total Prometheus example counter without labels\\n# TYPE prometheus_spec_counter_no_labels_total counter\\nprometheus_spec_counter_no_labels_total 1.0\\n# HELP prometheus_spec_counter_with_labels_total Prometheus example counter with labels\\n# TYPE prometheus_spec_counter_with_labels_total counter\\nprometheus_spec_counter_with_labels_total{foo=\\"bar\\"} 2.0\\n"]')
+
+
+def test_prometheus_get_metrics_returns_only_the_series_changed_since_reset():
+    counter_with_labels.labels("bar").inc(1)
+    counter_with_labels.labels("baz").inc(1)
+    reset()
+
+    counter_with_labels.labels("baz").inc(3)
+    counter_no_labels.inc(0)
+
+    metrics = get_metrics()
+
+    assert metrics == """# HELP prometheus_spec_counter_with_labels_total Prometheus example counter with labels
+# TYPE prometheus_spec_counter_with_labels_total counter
+prometheus_spec_counter_with_labels_total{foo="baz"} 3.0
+"""
+
+
+def test_prometheus_get_metrics_returns_the_metrics_in_registration_order():
+    histogram_no_labels.observe(1)
+    counter_no_labels.inc(1)
+
+    metrics = get_metrics()
+
+    assert metrics.index("prometheus_spec_counter_no_labels_total") < metrics.index("prometheus_spec_histogram_no_labels")
+
+
+def test_prometheus_reset_ignores_metrics_not_in_the_global_registry():
+    counter_not_registered = Counter(
+        name="prometheus_spec_counter_not_registered",
+        documentation="Prometheus example counter not registered",
+        registry=None
+    )
+    counter_not_registered.inc(1)
+
+    reset()
+
+    assert counter_not_registered._value.get() == 1
+
+
+@patch('builtins.print')
+@patch.dict(os.environ, {"PYTEST_CURRENT_TEST": ""})
+def test_prometheus_flush_metrics_in_compact_format(mock_print):
+    Config.override(METRICS_FORMAT="compact")
+    try:
+        counter_no_labels.inc(1)
+
+        flush_metrics()
+    finally:
+        Config.reload()
+
+    line = mock_print.call_args.args[0]
+    assert line.startswith("PROMDELTA ")
+    assert Decoder().decode(line) == [("prometheus_spec_counter_no_labels_total", {}, 1.0)]
+
+
+@patch('builtins.print')
+@patch.dict(os.environ, {"PYTEST_CURRENT_TEST": ""})
+def test_prometheus_flush_metrics_in_emf_format(mock_print):
+    Config.override(METRICS_FORMAT="emf", METRICS_EMF_NAMESPACE="spec")
+    try:
+        counter_no_labels.inc(1)
+        histogram_with_labels.labels("bar").observe(2)
+        counter_with_labels.labels("bar").inc(3)
+
+        flush_metrics()
+    finally:
+        Config.reload()
+
+    no_labels, with_labels = [json.loads(call.args[0]) for call in mock_print.call_args_list]
+    assert no_labels["_aws"]["CloudWatchMetrics"] == [{
+        "Namespace": "spec",
+        "Dimensions": [[]],
+        "Metrics": [{"Name": "prometheus_spec_counter_no_labels_total", "Unit": "Count"}],
+    }]
+    assert no_labels["prometheus_spec_counter_no_labels_total"] == 1.0
+    assert with_labels["_aws"]["CloudWatchMetrics"][0]["Dimensions"] == [["foo"]]
+    assert with_labels["_aws"]["CloudWatchMetrics"][0]["Metrics"] == [
+        {"Name": "prometheus_spec_counter_with_labels_total", "Unit": "Count"},
+        {"Name": "prometheus_spec_histogram_with_labels_count", "Unit": "Count"},
+        {"Name": "prometheus_spec_histogram_with_labels_sum", "Unit": "None"},
+    ]
+    assert with_labels["foo"] == "bar"
+    assert with_labels["prometheus_spec_histogram_with_labels_sum"] == 2.0
+
+
+def test_prometheus_emf_exporter_respects_the_document_limits():
+    labelnames = [f"label_{i}" for i in range(35)]
+    counters = [Counter(f"prometheus_spec_emf_{i}", "EMF counter", labelnames=labelnames, registry=None) for i in range(150)]
+    touched = []
+    for counter in counters:
+        metric = counter.labels(*labelnames)
+        metric.inc(1)
+        touched.append((counter, [metric]))
+
+    documents = [json.loads(line) for line in EmfExporter().export(touched)]
+
+    assert [len(document["_aws"]["CloudWatchMetrics"][0]["Metrics"]) for document in documents] == [100, 50]
+    assert documents[0]["_aws"]["CloudWatchMetrics"][0]["Dimensions"] == [labelnames[:30]]
+    # The labels over the dimensions limit are kept as properties
+    assert documents[0]["label_34"] == "label_34"
+
+
+@patch('builtins.print')
+@patch.dict(os.environ, {"PYTEST_CURRENT_TEST": ""})
+def test_prometheus_flush_metrics_with_a_registered_exporter(mock_print):
+    class CountExporter(Exporter):
+        def export(self, touched):
+            return [f"COUNT {len(touched)}"]
+
+    register_exporter("count", CountExporter())
+    Config.override(METRICS_FORMAT="count")
+    try:
+        counter_no_labels.inc(1)
+
+        flush_metrics()
+    finally:
+        Config.reload()
+
+    mock_print.assert_called_with("COUNT 1")
+
+
+def test_prometheus_exporters_must_implement_export():
+    class IncompleteExporter(Exporter):
+        pass
+
+    with pytest.raises(TypeError):
+        IncompleteExporter()
+
+
+@patch('builtins.print')
+@patch.dict(os.environ, {"PYTEST_CURRENT_TEST": ""})
+def test_prometheus_flush_metrics_falls_back_to_promlog_with_an_unknown_format(mock_print):
+    Config.override(METRICS_FORMAT="unknown")
+    try:
+        counter_no_labels.inc(1)
+
+        flush_metrics()
+        flush_metrics()
+    finally:
+        Config.reload()
+
+    lines = [call.args[0] for call in mock_print.call_args_list]
+    assert sum(1 for line in lines if "Unknown metrics format" in line) == 1
+    assert lines[-1].startswith("PROMLOG [")
+
+
+@pytest.fixture()
+def bounded_counter():
+    bounded_counter = Counter(
+        name="prometheus_spec_bounded_counter",
+        documentation="Prometheus example counter with bounded series",
+        labelnames=["foo"]
+    )
+    yield bounded_counter
+    Config.reload()
+    REGISTRY.unregister(bounded_counter)
+
+
+def test_prometheus_series_limit_evicts_the_least_recently_changed_series(bounded_counter):
+    Config.override(METRICS_MAX_SERIES=2)
+    bounded_counter.labels("a").inc(1)
+    bounded_counter.labels("b").inc(1)
+    reset()
+    bounded_counter.labels("b").inc(1)
+    reset()
+
+    bounded_counter.labels("c").inc(1)
+
+    assert sorted(bounded_counter._metrics) == [("b",), ("c",)]
+    assert 'lambda_powertools_metric_series_evicted_total{reason="limit"} 1.0' in get_metrics()
+
+
+def test_prometheus_series_limit_merges_new_series_into_the_overflow_series(bounded_counter):
+    Config.override(METRICS_MAX_SERIES=2)
+    bounded_counter.labels("a").inc(1)
+    bounded_counter.labels("b").inc(1)
+    bounded_counter.labels("c").inc(1)
+    bounded_counter.labels(foo="d").inc(1)
+
+    assert sorted(bounded_counter._metrics) == [("__overflow__",), ("a",), ("b",)]
+    assert bounded_counter.labels("__overflow__")._value.get() == 2
+    assert 'lambda_powertools_metric_series_evicted_total{reason="overflow"} 2.0' in get_metrics()
+
+    with pytest.raises(ValueError):
+        bounded_counter.labels("e", "f")
+
+
+def test_prometheus_idle_series_are_evicted(bounded_counter):
+    Config.override(METRICS_SERIES_MAX_IDLE=1)
+    bounded_counter.labels("a").inc(1)
+    bounded_counter.labels("b").inc(1)
+    reset()
+    bounded_counter.labels("b").inc(1)
+    reset()
+
+    assert sorted(bounded_counter._metrics) == [("b",)]
+    assert 'lambda_powertools_metric_series_evicted_total{reason="idle"} 1.0' in get_metrics()
+
+
+def test_prometheus_evicted_series_kept_by_the_caller_are_restored_when_changed(bounded_counter):
+    Config.override(METRICS_SERIES_MAX_IDLE=1)
+    kept = bounded_counter.labels("a")
+    kept.inc(1)
+    for _ in range(3):
+        reset()
+    assert ("a",) not in bounded_counter._metrics
+
+    kept.inc(2)
+
+    assert bounded_counter._metrics[("a",)] is kept
+    assert 'prometheus_spec_bounded_counter_total{foo="a"} 2.0' in get_metrics()
+
+
+def test_prometheus_series_created_after_an_eviction_are_bounded(bounded_counter):
+    Config.override(METRICS_MAX_SERIES=2)
+    for name in ("n0", "n1", "n2", "n3"):
+        bounded_counter.labels(name)
+        reset()
+
+    bounded_counter.labels("n4").inc(1)
+
+    assert sorted(bounded_counter._metrics) == [("n3",), ("n4",)]
+    assert 'lambda_powertools_metric_series_evicted_total{reason="overflow"}' not in get_metrics()
+
+
+def test_prometheus_series_of_collectors_not_in_the_global_registry_are_not_evicted():
+    registry = CollectorRegistry()
+    private_counter = Counter(
+        name="prometheus_spec_private_counter",
+        documentation="Prometheus example counter in a private registry",
+        labelnames=["foo"],
+        registry=registry
+    )
+    Config.override(METRICS_MAX_SERIES=100, METRICS_SERIES_MAX_IDLE=1)
+    try:
+        private_counter.labels("a").inc(5)
+        for _ in range(3):
+            reset()
+    finally:
+        Config.reload()
+
+    assert 'prometheus_spec_private_counter_total{foo="a"} 5.0' in generate_latest(registry).decode("utf-8")
+
+
+def test_prometheus_get_metrics_returns_gauges_and_summaries():
+    gauge_with_labels.labels("bar").set(0)
+    summary_with_labels.labels("bar").observe(2)
+    summary_with_labels.labels("bar").observe(3)
+
+    metrics = get_metrics()
+
+    assert metrics == """# HELP prometheus_spec_gauge_with_labels Prometheus example gauge with labels
+# TYPE prometheus_spec_gauge_with_labels gauge
+prometheus_spec_gauge_with_labels{foo="bar"} 0.0
+# HELP prometheus_spec_summary_with_labels Prometheus example summary with labels
+# TYPE prometheus_spec_summary_with_labels summary
+prometheus_spec_summary_with_labels_count{foo="bar"} 2.0
+prometheus_spec_summary_with_labels_sum{foo="bar"} 5.0
+"""
+
+    reset()
+
+    assert summary_with_labels.labels("bar")._count.get() == 0
+    assert get_metrics() == ""
+
+
+@pytest.mark.parametrize("mode,expected", [("last", 2.0), ("max", 5.0), ("sum", 10.0)])
+def test_prometheus_gauge_mode_applies_to_the_values_set_in_the_execution(mode, expected):
+    set_gauge_mode(gauge_with_labels, mode)
+    try:
+        gauge_with_labels.labels("bar").set(100)
+        reset()
+
+        gauge_with_labels.labels("bar").set(3)
+        gauge_with_labels.labels("bar").set(5)
+        gauge_with_labels.labels("bar").set(2)
+
+        assert gauge_with_labels.labels("bar")._value.get() == expected
+    finally:
+        set_gauge_mode(gauge_with_labels, "last")
+
+
+def test_prometheus_set_gauge_mode_rejects_unknown_modes():
+    with pytest.raises(ValueError):
+        set_gauge_mode(gauge, "min")
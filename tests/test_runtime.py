@@ -1,26 +1,31 @@
 import os
+import asyncio
 import json
 import builtins
-import datetime
+import time
 import pytest
 from unittest import mock
+from lambda_powertools import runtime
 from lambda_powertools.runtime import power_handler
 from lambda_powertools.logger import logger
+from lambda_powertools.utils import MonotonicClock
+from lambda_powertools.config import Config
 
-MOCK_DATE_MS = 1679313252.708
+MOCK_TIME_NS = 1679313252708 * 1000000
 
 
 @pytest.fixture(autouse=True)
-def patch_datetime_now(monkeypatch):
-    class MyDateTime:
-        @classmethod
-        def now(cls):
-            return MyDateTime()
+def patch_time_ns(monkeypatch):
+    monkeypatch.setattr(time, 'time_ns', lambda: MOCK_TIME_NS)
+    # The logger clock advances from the wall clock time read on reset, so the time of a log could move past
+    # the mocked millisecond: keep it still
+    monkeypatch.setattr(MonotonicClock, 'now_ms', lambda self: self._anchor_ms)
 
-        def timestamp(self):
-            return MOCK_DATE_MS
 
-    monkeypatch.setattr(datetime, 'datetime', MyDateTime)
+@pytest.fixture(autouse=True)
+def reload_config():
+    yield
+    Config.reload()
 
 
 @mock.patch.dict(os.environ, {"AWS_LAMBDA_FUNCTION_NAME": "lambda-powertools-runtime"})
@@ -60,3 +65,120 @@ def test_power_handler_initialize_the_logger_to_properly_capture_context(mocker)
         "loglevel": "INFO",
         "message": "this is a log"
     })))
+
+
+def test_power_handler_flushes_buffered_logs_when_the_handler_raises(mocker):
+    Config.override(LOG_BUFFER_ENABLED=True)
+    print_spy = mocker.spy(builtins, "print")
+
+    def lambda_body(event, context):
+        logger.info("this is a log")
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        power_handler(lambda_body)({}, context=type('', (object,), {"aws_request_id": "awsRequestId"})())
+
+    print_spy.assert_called_once()
+    assert '"message": "this is a log"' in print_spy.call_args.args[0]
+
+
+def test_power_handler_runs_async_handlers_on_the_same_event_loop(mocker):
+    print_spy = mocker.spy(builtins, "print")
+    loops = []
+
+    async def lambda_body(event, context):
+        await asyncio.sleep(0)
+        loops.append(asyncio.get_running_loop())
+        logger.info("this is a log")
+        return {"foo": "bar"}
+
+    context = type('', (object,), {"aws_request_id": "awsRequestId"})()
+    assert power_handler(lambda_body)({}, context) == {"foo": "bar"}
+    assert power_handler(lambda_body)({}, context) == {"foo": "bar"}
+
+    assert loops[0] is loops[1]
+    assert print_spy.call_count == 2
+    assert '"aws_request_id": "awsRequestId"' in print_spy.call_args.args[0]
+
+
+def test_power_handler_raises_the_error_of_async_handlers():
+    async def lambda_body(event, context):
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        power_handler(lambda_body)({}, type('', (object,), {"aws_request_id": "awsRequestId"})())
+
+
+def test_power_handler_waits_for_the_background_output(mocker):
+    Config.override(OUTPUT_BACKGROUND_ENABLED=True)
+    print_spy = mocker.spy(builtins, "print")
+
+    def lambda_body(event, context):
+        logger.info("this is a log")
+
+    power_handler(lambda_body)({}, type('', (object,), {"aws_request_id": "awsRequestId"})())
+
+    print_spy.assert_called_once()
+    assert '"message": "this is a log"' in print_spy.call_args.args[0]
+
+
+def test_power_handler_records_the_instrumentation_metrics(mocker):
+    Config.override(INSTRUMENTATION_ENABLED=True)
+    flush_spy = mocker.spy(runtime.get_prometheus(), "flush_metrics")
+    exported = []
+    flush_spy.side_effect = lambda: exported.append(runtime.get_prometheus().get_metrics())
+
+    def lambda_body(event, context):
+        return {"foo": "bar"}
+
+    context = type('', (object,), {"aws_request_id": "awsRequestId"})()
+    assert power_handler(lambda_body)({}, context) == {"foo": "bar"}
+    assert power_handler(lambda_body)({}, context) == {"foo": "bar"}
+
+    assert "lambda_powertools_handler_duration_seconds_count 1.0" in exported[0]
+    assert 'lambda_powertools_overhead_seconds_count{phase="capture"} 1.0' in exported[0]
+    assert 'lambda_powertools_overhead_seconds_count{phase="reset"} 1.0' in exported[0]
+    # The flush is measured after the metrics are written, so it's exported by the following execution
+    assert 'phase="flush"' not in exported[0]
+    assert 'lambda_powertools_overhead_seconds_count{phase="flush"} 1.0' in exported[1]
+    assert "lambda_powertools_cold_start 0.0" in exported[1]
+
+
+def test_power_handler_does_not_record_the_instrumentation_metrics_by_default(mocker):
+    flush_spy = mocker.spy(runtime.get_prometheus(), "flush_metrics")
+    exported = []
+    flush_spy.side_effect = lambda: exported.append(runtime.get_prometheus().get_metrics())
+
+    power_handler(lambda event, context: None)({}, type('', (object,), {"aws_request_id": "awsRequestId"})())
+
+    assert "lambda_powertools" not in exported[0]
+
+
+def test_power_handler_profiles_the_memory_when_requested(mocker):
+    Config.override(MEMORY_PROFILING_TRACEMALLOC=True, MEMORY_PROFILING_TOP=3)
+    print_spy = mocker.spy(builtins, "print")
+    flush_spy = mocker.spy(runtime.get_prometheus(required=True), "flush_metrics")
+    exported = []
+    flush_spy.side_effect = lambda: exported.append(runtime.get_prometheus().get_metrics())
+
+    def lambda_body(event, context):
+        return [bytearray(1024) for _ in range(100)]
+
+    power_handler(lambda_body)({"headers": {"x-profile-memory": "true"}}, type('', (object,), {"aws_request_id": "awsRequestId"})())
+
+    log = json.loads(print_spy.call_args.args[0])
+    assert log["message"] == "Memory profile"
+    assert log["peak_rss_delta_bytes"] >= 0
+    top_allocations = json.loads(log["top_allocations"])
+    assert len(top_allocations) == 3
+    assert top_allocations[0]["site"].endswith("test_runtime.py:" + str(lambda_body.__code__.co_firstlineno + 1))
+    assert "lambda_powertools_memory_peak_rss_delta_bytes" in exported[0]
+    assert "lambda_powertools_memory_traced_peak_bytes" in exported[0]
+
+
+def test_power_handler_does_not_profile_the_memory_by_default(mocker):
+    print_spy = mocker.spy(builtins, "print")
+
+    power_handler(lambda event, context: None)({"headers": {}}, type('', (object,), {"aws_request_id": "awsRequestId"})())
+
+    print_spy.assert_not_called()
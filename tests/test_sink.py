@@ -0,0 +1,82 @@
+import builtins
+import threading
+from lambda_powertools.sink import BackgroundWriter, BufferedSink
+
+
+def test_background_writer_writes_the_output_in_background(mocker):
+    print_spy = mocker.spy(builtins, "print")
+    writer = BackgroundWriter(max_size=10, block=True)
+
+    writer.write("foo\n")
+    writer.write("bar\n")
+    writer.drain()
+
+    output = "".join(call.args[0] for call in print_spy.call_args_list)
+    assert output == "foo\nbar\n"
+    assert all(call.kwargs == {"end": "", "flush": True} for call in print_spy.call_args_list)
+    assert threading.current_thread() is not writer._thread
+
+
+def test_background_writer_drops_the_output_when_full(mocker):
+    writing = threading.Event()
+    unblock = threading.Event()
+    written = []
+
+    def slow_print(output, **kwargs):
+        writing.set()
+        unblock.wait()
+        written.append(output)
+
+    mocker.patch("builtins.print", side_effect=slow_print)
+    writer = BackgroundWriter(max_size=1, block=False)
+
+    writer.write("1\n")
+    # The thread is writing the first output, so the queue has room for exactly one more
+    writing.wait()
+    writer.write("2\n")
+    writer.write("3\n")
+    unblock.set()
+    writer.drain()
+
+    assert writer.dropped == 1
+    assert "".join(written) == "1\n2\n"
+
+
+def test_background_writer_counts_the_outputs_dropped_by_concurrent_writers(mocker):
+    writing = threading.Event()
+    unblock = threading.Event()
+
+    def slow_print(output, **kwargs):
+        writing.set()
+        unblock.wait()
+
+    mocker.patch("builtins.print", side_effect=slow_print)
+    writer = BackgroundWriter(max_size=1, block=False)
+    writer.write("1\n")
+    writing.wait()
+    writer.write("2\n")
+
+    def write_outputs():
+        for _ in range(1000):
+            writer.write("3\n")
+
+    threads = [threading.Thread(target=write_outputs) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    unblock.set()
+    writer.drain()
+
+    assert writer.dropped == 8000
+
+
+def test_buffered_sink_writes_through_the_writer(mocker):
+    writer = mocker.Mock()
+    buffered_sink = BufferedSink(max_records=10, max_bytes=1000, writer=writer)
+
+    buffered_sink.write("foo")
+    buffered_sink.write("bar")
+    buffered_sink.flush()
+
+    writer.write.assert_called_once_with("foo\n\nbar\n\n")
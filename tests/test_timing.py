@@ -0,0 +1,115 @@
+import gc
+import asyncio
+import weakref
+import pytest
+from prometheus_client import Histogram, Summary
+from lambda_powertools.timing import timed
+from lambda_powertools import prometheus
+from lambda_powertools.config import Config
+
+duration = Histogram(
+    name="timing_spec_duration_seconds",
+    documentation="Timing example histogram",
+    labelnames=["operation", "outcome"]
+)
+
+duration_no_outcome = Summary(
+    name="timing_spec_duration_no_outcome_seconds",
+    documentation="Timing example summary without outcome"
+)
+
+
+def get_count(outcome):
+    return duration.labels("fetch", outcome)._sum.get(), sum(bucket.get() for bucket in duration.labels("fetch", outcome)._buckets)
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    duration.clear()
+    duration_no_outcome._count.set(0)
+    yield
+    Config.reload()
+
+
+def test_timed_block_observes_the_outcome():
+    with timed(duration, operation="fetch"):
+        pass
+
+    with pytest.raises(ValueError):
+        with timed(duration, operation="fetch"):
+            raise ValueError("boom")
+
+    assert get_count("success")[1] == 1
+    assert get_count("failure")[1] == 1
+
+
+def test_timed_function_observes_the_outcome():
+    @timed(duration, operation="fetch")
+    def fetch(fail):
+        if fail:
+            raise ValueError("boom")
+        return "result"
+
+    assert fetch(False) == "result"
+    with pytest.raises(ValueError):
+        fetch(True)
+
+    assert get_count("success")[1] == 1
+    assert get_count("failure")[1] == 1
+
+
+def test_timed_async_function_observes_the_outcome():
+    @timed(duration, operation="fetch")
+    async def fetch():
+        await asyncio.sleep(0.01)
+        return "result"
+
+    assert asyncio.run(fetch()) == "result"
+
+    total, count = get_count("success")
+    assert count == 1
+    assert total >= 0.01
+
+
+def test_timed_metric_without_outcome_label():
+    with timed(duration_no_outcome):
+        pass
+
+    assert duration_no_outcome._count.get() == 1
+
+
+def test_timed_does_nothing_when_disabled():
+    Config.override(METRICS_TIMING_ENABLED=False)
+
+    @timed(duration, operation="fetch")
+    def fetch():
+        return "result"
+
+    with timed(duration, operation="fetch"):
+        assert fetch() == "result"
+
+    assert get_count("success")[1] == 0
+
+
+def test_timed_function_looks_up_the_children_again_when_removed():
+    @timed(duration, operation="fetch")
+    def fetch():
+        pass
+
+    fetch()
+    duration.remove("fetch", "success")
+    fetch()
+
+    assert get_count("success")[1] == 1
+
+
+def test_timed_blocks_do_not_keep_the_children_of_their_labels():
+    with timed(duration, operation="rare"):
+        pass
+    child = weakref.ref(duration.labels("rare", "success"))
+    duration.clear()
+    # The changed series are referenced until the next reset
+    prometheus.reset()
+    gc.collect()
+
+    assert child() is None
@@ -0,0 +1,117 @@
+import json
+import threading
+from lambda_powertools.utils import serialize_log, serialize_log_limited, serialize_fields, set_json_backend, TokenBucket, MonotonicClock, StackFormatter
+
+
+def test_serialize_log_matches_json_dumps():
+    log = {"str": "fooè", "int": 1, "float": 1.5, "bool": True, "none": None}
+
+    assert serialize_log(log) == json.dumps(log)
+
+
+def test_serialize_log_encodes_nested_objects_as_strings():
+    log = {"list": [1, 2], "dict": {"foo": {"bar": "baz"}}}
+
+    assert serialize_log(log) == json.dumps({"list": "[1, 2]", "dict": '{"foo": {"bar": "baz"}}'})
+
+
+def test_serialize_log_replaces_not_finite_numbers_with_null():
+    class Float(float):
+        pass
+
+    log = {"nan": float("nan"), "inf": float("inf"), "subclass": Float("nan")}
+
+    assert serialize_log(log) == json.dumps({"nan": None, "inf": None, "subclass": None})
+
+
+def test_serialize_log_prepends_the_provided_prefix():
+    prefix = serialize_fields({"foo": "bar"})
+
+    assert serialize_log({"baz": 1}, prefix=prefix) == json.dumps({"foo": "bar", "baz": 1})
+    assert serialize_log({}, prefix=prefix) == json.dumps({"foo": "bar"})
+
+
+def test_serialize_log_uses_the_provided_json_backend():
+    set_json_backend(lambda value: "custom")
+    try:
+        assert serialize_log({"foo": [1]}) == json.dumps({"foo": "custom"})
+    finally:
+        set_json_backend(None)
+
+
+def test_serialize_log_limited_truncates_oversized_fields():
+    log_str, truncated = serialize_log_limited({"str": "a" * 100, "dict": {"foo": "b" * 100}, "int": 1}, max_field_bytes=30)
+
+    assert truncated
+    log = json.loads(log_str)
+    assert log["str"] == "a" * 14 + "...[truncated]"
+    assert log["dict"] == '{"foo": "bb...[truncated]'
+    assert log["int"] == 1
+    assert log["log_truncated"] is True
+
+
+def test_serialize_log_limited_does_not_split_escape_sequences():
+    log_str, _ = serialize_log_limited({"str": "\u00e8" * 10}, max_field_bytes=30)
+
+    assert json.loads(log_str)["str"] == "\u00e8" * 2 + "...[truncated]"
+
+
+def test_serialize_log_limited_fits_the_record_limit():
+    prefix = serialize_fields({"foo": "bar"})
+    log = {"big": "a" * 1000, "small": "b" * 10, "message": "c" * 200}
+
+    log_str, truncated = serialize_log_limited(log, prefix=prefix, max_record_bytes=300)
+
+    assert truncated
+    assert len(log_str) <= 300
+    parsed = json.loads(log_str)
+    assert parsed["foo"] == "bar"
+    assert parsed["small"] == "b" * 10
+    assert parsed["big"].endswith("...[truncated]")
+
+
+def test_serialize_log_limited_does_not_change_logs_within_the_limits():
+    log = {"str": "fooè", "dict": {"foo": [1, 2]}, "float": 1.5}
+
+    assert serialize_log_limited(log, max_field_bytes=100, max_record_bytes=1000) == (serialize_log(log), False)
+
+
+def test_token_bucket_allows_up_to_capacity_operations():
+    bucket = TokenBucket(2)
+
+    assert bucket.consume() is True
+    assert bucket.consume() is True
+    assert bucket.consume() is False
+
+
+def test_monotonic_clock_advances_from_the_anchored_wall_clock_time(monkeypatch):
+    clock = MonotonicClock()
+    monkeypatch.setattr(clock, "_anchor_ns", clock._anchor_ns - 5 * 1000000)
+
+    # The time of the logs is not the anchored one, so the tests asserting an exact time must freeze the clock
+    assert clock.now_ms() >= clock._anchor_ms + 5
+
+
+def test_stack_formatter_cache_is_bounded_when_used_by_multiple_threads():
+    formatter = StackFormatter(max_frames=0, max_cached=2)
+    error_types = [type(f"Error{i}", (Exception,), {}) for i in range(50)]
+    failures = []
+
+    def format_errors():
+        try:
+            for error_type in error_types:
+                try:
+                    raise error_type("boom")
+                except Exception as e:
+                    formatter.format(e)
+        except Exception as e:
+            failures.append(e)
+
+    threads = [threading.Thread(target=format_errors) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert failures == []
+    assert len(formatter._cache) <= 2